@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time and memory benchmark of the analysis pipeline on synthetic traces.
+
+    python benchmark.py --fixes 1e6 --out bench.csv
+
+Created on Sun Oct 18 08:01:05 2026
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+import synthetic
+from loader import buildCache, loadTagged
+from geofence import terminal
+from segment import segmentRoutes
+from dose import routeDose
+from dwell import dwellMatrix
+from summary import summaryTable
+from regrid import sensorGrid
+from tracestore import TraceStore
+from profiling import peakRSS
+
+# modules that must import with only numpy and pandas (and pyarrow, which
+# pandas loads itself when it is installed)
+CORE = ['loader', 'segment', 'geofence', 'dose', 'dwell', 'summary', 'binning',
+        'calibration', 'chunked', 'resultcache', 'colocation', 'wind', 'tiles',
+        'spatiotemporal', 'profiling', 'linref', 'quality', 'regrid', 'montecarlo',
+        'tracestore']
+HEAVY = ['matplotlib', 'geopandas', 'cartopy', 'pyproj', 'shapely', 'scipy', 'sklearn',
+         'statsmodels', 'xarray', 'contextily']
+
+
+def importCheck(modules=CORE, heavy=HEAVY):
+    '''
+    Time importing `modules` in a fresh interpreter, after numpy and pandas.
+
+    Returns
+    -------
+    row : dict
+        stage and seconds, as in measure().
+    loaded : list
+        Packages of `heavy` that the import pulled in; should be empty.
+
+    '''
+    code = ('import sys, time\n'
+            'import numpy, pandas\n'
+            't = time.perf_counter()\n'
+            f'import {", ".join(modules)}\n'
+            'print(time.perf_counter() - t)\n'
+            'print(" ".join({m.split(".")[0] for m in sys.modules}))')
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         check=True, cwd=Path(__file__).resolve().parent).stdout.split('\n')
+    loaded = sorted(set(out[1].split()) & set(heavy))
+    return {'stage': 'import (core)', 'seconds': float(out[0])}, loaded
+
+
+def measure(name, func, *args, memory=False, **kwargs):
+    '''
+    Run func once, recording wall time and the process' peak RSS so far.
+
+    With memory=True the stage's own peak allocation is also traced with
+    tracemalloc. That is exact but slows down Python-heavy stages a lot, so
+    it is off by default.
+
+    Returns
+    -------
+    result : object
+        Whatever func returns.
+    row : dict
+        stage, seconds, maxrss_mb and, with memory=True, peak_mb.
+
+    '''
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    row = {'stage': name, 'seconds': time.perf_counter() - start,
+           'maxrss_mb': peakRSS()}
+    if memory:
+        row['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, row
+
+
+def render(df, path, mode='points'):
+    '''
+    Draw every fix coloured by PM2.5, as the map panels do, on Agg: as
+    scatter markers, or aggregated with spatiotemporal.rasterize().
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(4, 5), dpi=200)
+    if mode == 'raster':
+        from spatiotemporal import EXTENT, rasterize
+        img = rasterize(df['Longitude'], df['Latitude'], df['calib_pm25'])
+        ax.imshow(img, extent=EXTENT, origin='lower', cmap='rainbow', vmin=0, vmax=90,
+                  interpolation='nearest')
+    else:
+        ax.scatter(df['Longitude'], df['Latitude'], c=df['calib_pm25'], cmap='rainbow',
+                   vmin=0, vmax=90, s=9, edgecolors='k', linewidths=0.2)
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+
+
+def run(fixes=1e6, sensors=7, workdir=None, seed=0, memory=False):
+    '''
+    Benchmark every stage on about `fixes` synthetic fixes.
+
+    Returns
+    -------
+    DataFrame
+        One row per stage: seconds, maxrss_mb, peak_mb (with memory=True)
+        and rows.
+
+    '''
+    workdir = Path(workdir or tempfile.mkdtemp(prefix='pm25-bench-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    csv = workdir/'Alldata_tagged.csv'
+    days = synthetic.daysFor(fixes, sensors)
+    rows = []
+
+    row, loaded = importCheck()
+    rows.append(row)
+    if loaded:
+        print(f'core modules import {", ".join(loaded)}')
+
+    start = time.perf_counter()
+    synthetic.writeTraces(csv, sensors, days, seed=seed)
+    print(f'generated {csv} in {time.perf_counter() - start:.1f} s')
+
+    _, row = measure('load (build cache)', buildCache, csv, memory=memory)
+    rows.append(row)
+    df, row = measure('load (cached)', loadTagged, csv, memory=memory)
+    rows.append(row)
+    n = len(df)
+
+    df.sort_values(['sensor', 'datetime_fixed'], inplace=True)
+    inTerminal, row = measure('terminal geofence', terminal.contains,
+                              df['Longitude'].values, df['Latitude'].values, memory=memory)
+    rows.append(row)
+    _, row = measure('segment', segmentRoutes, df['datetime_fixed'].values, inTerminal,
+                     df['sensor'].values, memory=memory)
+    rows.append(row)
+    _, row = measure('dose', routeDose, df, memory=memory)
+    rows.append(row)
+    _, row = measure('dwell', dwellMatrix, df, maxGap=60, memory=memory)
+    rows.append(row)
+    _, row = measure('summary', summaryTable, df, memory=memory)
+    rows.append(row)
+    _, row = measure('sensor grid', sensorGrid, df, maxGap=60, memory=memory)
+    rows.append(row)
+    store, row = measure('trace store', TraceStore, df, memory=memory)
+    rows.append(row)
+    print(store.memory(df).round(1).to_string())
+    _, row = measure('render', render, df, workdir/'scatter.png', memory=memory)
+    rows.append(row)
+    _, row = measure('render (raster)', render, df, workdir/'raster.png', 'raster', memory=memory)
+    rows.append(row)
+
+    report = pd.DataFrame(rows).set_index('stage')
+    report['rows'] = n
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--fixes', type=float, default=1e6, help='approximate number of fixes')
+    parser.add_argument('--sensors', type=int, default=7)
+    parser.add_argument('--workdir', type=Path, help='where the synthetic data is written')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true', help='trace per-stage peak allocations (slow)')
+    parser.add_argument('--out', type=Path, help='write the report to this CSV')
+    parser.add_argument('--check-imports', action='store_true',
+                        help='only check that the core modules import no plotting/geo/stats packages')
+    args = parser.parse_args()
+
+    if args.check_imports:
+        row, loaded = importCheck()
+        print(f"import (core): {row['seconds']:.3f} s")
+        if loaded:
+            sys.exit(f'core modules import {", ".join(loaded)}')
+        sys.exit()
+
+    report = run(args.fixes, args.sensors, args.workdir, args.seed, args.memory)
+    print(report.round(3).to_string())
+    if args.out:
+        report.to_csv(args.out)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatial binning of the raw traces into the *_SpatiallyGrouped layers read by
+spatiotemporal.py. Fixes are snapped to a square or hex grid and every
+temporal stratum is aggregated from one grouped pass.
+Created on Sun Oct 18 08:01:44 2026
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from profiling import timed
+
+DEG = 111320.0  # metres per degree of latitude
+
+
+def rushPeriod(df):
+    '''AMPEAK / OFFPEAK / PMPEAK, split the same way as quantitative.py.'''
+    peak = (df['Timegroup'] == 'peak').values
+    hour = df['Hour'].values
+    return np.select([peak & (hour > 6) & (hour <= 12), peak & (hour > 12),
+                      (df['Timegroup'] == 'offpeak').values],
+                     ['AMPEAK', 'PMPEAK', 'OFFPEAK'], default=None)
+
+
+# stratum name -> column or function of the traces giving each fix's group;
+# a fix with no group (None/NaN) is left out of that stratum only
+STRATA = {'Rush': rushPeriod,
+          'Day': 'Day',
+          'Hour': 'Hour'}
+
+
+def _scale(lat):
+    '''Degrees per metre along lon and lat at the data's mean latitude.'''
+    return 1 / (DEG * np.cos(np.radians(np.nanmean(lat)))), 1 / DEG
+
+
+def snap(lon, lat, size=50, shape='square'):
+    '''
+    Grid cell of every fix.
+
+    Parameters
+    ----------
+    lon, lat : array
+        Fix coordinates.
+    size : num, optional
+        Cell size in metres (side of a square, or centre-to-vertex of a
+        pointy-top hexagon). The default is 50.
+    shape : 'square' or 'hex', optional
+        The default is 'square'.
+
+    Returns
+    -------
+    i, j : arrays of int
+        Cell indices (column/row for squares, axial q/r for hexagons).
+
+    '''
+    sx, sy = _scale(lat)
+    x = np.asarray(lon) / sx / size
+    y = np.asarray(lat) / sy / size
+
+    if shape == 'square':
+        return np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+
+    # axial coordinates, then cube rounding
+    q = np.sqrt(3) / 3 * x - y / 3
+    r = 2 / 3 * y
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fixQ = (dq > dr) & (dq > ds)
+    fixR = ~fixQ & (dr > ds)
+    rq = np.where(fixQ, -rr - rs, rq)
+    rr = np.where(fixR, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def centres(i, j, lat, size=50, shape='square'):
+    '''Lon/lat of cell centres, the inverse of snap().'''
+    sx, sy = _scale(lat)
+    if shape == 'square':
+        x, y = i + 0.5, j + 0.5
+    else:
+        x = np.sqrt(3) * (i + j / 2)
+        y = 1.5 * j
+    return x * size * sx, y * size * sy
+
+
+@timed()
+def binTraces(df, size=50, shape='square', strata=STRATA, threshold=90,
+              value='calib_pm25'):
+    '''
+    Mean, count and exceedance of PM2.5 per grid cell for every stratum.
+
+    The traces are reduced once, grouped by cell and the groups of every
+    stratum together. Each stratum (and 'All') is then rolled up from those
+    partial sums, so adding a stratum does not add a pass over the data.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Traces with Longitude, Latitude, the value and the stratum columns.
+    size, shape :
+        See snap().
+    strata : dict, optional
+        Stratum name -> column name or function(df). The default is STRATA.
+    threshold : num, optional
+        Exceedance threshold (µg/m3). The default is 90.
+
+    Returns
+    -------
+    DataFrame
+        stratum, group, i, j, Longitude, Latitude, calib_pm25 (cell mean),
+        count and exceedance (fraction of fixes above threshold).
+
+    '''
+    lat = df['Latitude'].values
+    i, j = snap(df['Longitude'].values, lat, size, shape)
+    c = df[value].values.astype(float)
+    ok = ~np.isnan(c)
+
+    keys = {'i': i[ok], 'j': j[ok]}
+    for name, how in strata.items():
+        labels = df[how].values if isinstance(how, str) else how(df)
+        keys[name] = np.asarray(labels)[ok]
+
+    partial = pd.DataFrame(keys)
+    partial['sum'] = c[ok]
+    partial['count'] = 1
+    partial['above'] = c[ok] > threshold
+    partial = partial.groupby(list(keys), dropna=False, sort=False).sum().reset_index()
+
+    layers = []
+    for name in ['All'] + list(strata):
+        by = ['i', 'j'] if name == 'All' else [name, 'i', 'j']
+        layer = partial.dropna(subset=by).groupby(by, sort=False)[['sum', 'count', 'above']].sum()
+        layer = layer.reset_index()
+        layer.insert(0, 'stratum', name)
+        layer.insert(1, 'group', 'All' if name == 'All' else layer.pop(name))
+        layers.append(layer)
+
+    out = pd.concat(layers, ignore_index=True)
+    out['Longitude'], out['Latitude'] = centres(out['i'].values, out['j'].values, lat, size, shape)
+    out[value] = out.pop('sum') / out['count']
+    out['exceedance'] = out.pop('above') / out['count']
+    return out
+
+
+def layerName(stratum, group):
+    '''File stem spatiotemporal.py expects for a stratum group.'''
+    if stratum == 'All':
+        return 'Alldata_SpatiallyGrouped'
+    if isinstance(group, (int, np.integer, float)):
+        group = f'{stratum}{int(group):02d}'
+    return f'Filtered_{group}_SpatiallyGrouped'
+
+
+def writeLayers(table, root, value='calib_pm25'):
+    '''
+    Write every stratum group of binTraces() as a point GeoJSON (WGS84).
+
+    Returns
+    -------
+    list
+        Paths written.
+
+    '''
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    written = []
+    for (stratum, group), layer in table.groupby(['stratum', 'group'], sort=False):
+        features = [{'type': 'Feature',
+                     'properties': {value: m, 'count': int(n), 'exceedance': e},
+                     'geometry': {'type': 'Point', 'coordinates': [x, y]}}
+                    for x, y, m, n, e in zip(layer['Longitude'], layer['Latitude'],
+                                             layer[value], layer['count'], layer['exceedance'])]
+        path = root/f'{layerName(stratum, group)}.geojson'
+        with open(path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f)
+        written.append(path)
+    return written
+
+
+if __name__ == "__main__":
+    import sys
+    from loader import loadTagged
+
+    # python binning.py Alldata_tagged.csv outdir [size] [square|hex]
+    df = loadTagged(sys.argv[1], usecols=['Longitude', 'Latitude', 'calib_pm25',
+                                          'Timegroup', 'Hour', 'Day'])
+    size = float(sys.argv[3]) if len(sys.argv) > 3 else 50
+    shape = sys.argv[4] if len(sys.argv) > 4 else 'square'
+    for path in writeLayers(binTraces(df, size, shape), sys.argv[2]):
+        print(path)
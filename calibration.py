@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Calibration regression of every co-located sensor against the BAM in one
+closed-form solve, with optional vectorized bootstrap intervals.
+Created on Sun Oct 18 07:57:24 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+from profiling import timed
+
+
+def _fit(x, Y):
+    '''
+    Closed-form OLS of every column of Y against x.
+
+    x : (..., n), Y : (..., n, k). Leading dimensions are batched, which is
+    how the bootstrap resamples are fitted all at once.
+    '''
+    xm = x.mean(axis=-1, keepdims=True)
+    Ym = Y.mean(axis=-2, keepdims=True)
+    dx = x - xm
+    sxx = (dx**2).sum(axis=-1)[..., None]
+    sxy = np.einsum('...n,...nk->...k', dx, Y - Ym)
+    slope = sxy / sxx
+    intercept = Ym[..., 0, :] - slope * xm
+    return slope, intercept, sxx
+
+
+@timed()
+def calibrate(df, reference='BAM', sensors=None, nboot=0, ci=95, seed=None, chunk=200):
+    '''
+    Regress every sensor column against the reference (y = m*BAM + b).
+
+    Parameters
+    ----------
+    df : DataFrame
+        One column per sensor plus the reference. Rows with any NaN are dropped.
+    reference : str, optional
+        Reference column. The default is 'BAM'.
+    sensors : list, optional
+        Sensor columns. The default is every column except the reference.
+    nboot : int, optional
+        Number of bootstrap resamples for confidence intervals. The default
+        is 0 (no bootstrap).
+    ci : num, optional
+        Confidence level of the bootstrap intervals, in %. The default is 95.
+    seed : int, optional
+        Seed for the bootstrap resampling.
+    chunk : int, optional
+        Resamples evaluated at once, to bound memory. The default is 200.
+
+    Returns
+    -------
+    DataFrame
+        One row per sensor: slope, intercept, their standard errors and
+        covariance (slope_intercept_cov), r2 and n, plus slope_lo/hi and intercept_lo/hi if nboot > 0.
+
+    '''
+    if sensors is None:
+        sensors = [c for c in df.columns if c != reference]
+    data = df[list(sensors) + [reference]].dropna()
+
+    x = data[reference].values.astype(float)
+    Y = data[list(sensors)].values.astype(float)
+    n = len(x)
+
+    slope, intercept, sxx = _fit(x, Y)
+    resid = Y - (intercept + slope * x[:, None])
+    sse = (resid**2).sum(axis=0)
+    syy = ((Y - Y.mean(axis=0))**2).sum(axis=0)
+    s2 = sse / (n - 2)
+
+    table = pd.DataFrame({'slope': slope,
+                          'intercept': intercept,
+                          'slope_se': np.sqrt(s2 / sxx),
+                          'intercept_se': np.sqrt(s2 * (1/n + x.mean()**2 / sxx)),
+                          'slope_intercept_cov': -x.mean() * s2 / sxx,
+                          'r2': 1 - sse / syy,
+                          'n': n}, index=pd.Index(sensors, name='sensor'))
+
+    if nboot > 0:
+        rng = np.random.default_rng(seed)
+        slopes, intercepts = [], []
+        for lo in range(0, nboot, chunk):
+            idx = rng.integers(0, n, size=(min(chunk, nboot - lo), n))
+            m, b, _ = _fit(x[idx], Y[idx])
+            slopes.append(m)
+            intercepts.append(b)
+
+        q = [(100 - ci) / 2, (100 + ci) / 2]
+        table['slope_lo'], table['slope_hi'] = np.percentile(np.vstack(slopes), q, axis=0)
+        table['intercept_lo'], table['intercept_hi'] = np.percentile(np.vstack(intercepts), q, axis=0)
+
+    return table
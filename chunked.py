@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Out-of-core execution of the dose, dwell and summary analyses. The traces are
+read in bounded-memory chunks, each chunk is reduced to partial aggregates,
+and the partials combine into the same tables routeDose(), dwellMatrix() and
+summaryTable() give on the whole dataset.
+Created on Sun Oct 18 08:04:19 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+from dose import SEDENTARY
+from dwell import TMElist, fixDurations
+from summary import STRATA, THRESHOLDS, partials, rollup
+from profiling import timed
+
+
+class ChunkedAnalysis:
+    '''
+    Accumulate dose, dwell and summary partials one chunk at a time.
+
+    Chunks can be any size but must be in time order per route, i.e. every
+    fix of a route in a chunk comes after that route's fixes in earlier
+    chunks (true for the tagged CSV, which is sorted by sensor and time).
+    Per-route boundary state (the last fix for dwell, the last two 15 s bins
+    for dose) is carried over so that nothing depends on where the chunks
+    are cut.
+
+    Parameters
+    ----------
+    rate : num or list, optional
+        Breathing rate(s), as in routeDose(). The default is sedentary.
+    freq : str, optional
+        Dose grid spacing. The default is '15s'.
+    zones, maxGap, cadence :
+        As in dwellMatrix().
+    strata, thresholds :
+        As in summaryTable().
+
+    '''
+
+    def __init__(self, rate=SEDENTARY, freq='15s', zones=TMElist, maxGap=None, cadence=15,
+                 strata=STRATA, thresholds=THRESHOLDS, route='Route.Number',
+                 time='datetime_fixed', zone='TME', value='calib_pm25'):
+        self.rate, self.freq = rate, freq
+        self.zones, self.maxGap, self.cadence = zones, maxGap, cadence
+        self.strata, self.thresholds = strata, thresholds
+        self.route, self.time, self.zone, self.value = route, time, zone, value
+
+        # dose: trapezoid sums and first bin per route, pending bins
+        self.integral = pd.Series(dtype=float)
+        self.firstBin = pd.Series(dtype=np.int64)
+        self.doseCarry = pd.DataFrame({'route': [], 'bin': [], 'value': []})
+        # dwell: seconds per route and zone, pending last fix per route
+        self.dwell = pd.DataFrame(columns=zones, dtype=float)
+        self.dwellCarry = pd.DataFrame({'route': [], 'time': [], 'zone': []})
+        # summary: partial sums per route and stratum groups
+        self.summary = None
+
+    @timed('chunk', rows=1)
+    def add(self, chunk):
+        '''Reduce one chunk of traces (a DataFrame with plain columns).'''
+        self._addDose(chunk)
+        self._addDwell(chunk)
+        part = partials(chunk, self.strata, self.thresholds, self.value, self.route)
+        if self.summary is not None:
+            keys = [self.route] + list(self.strata)
+            part = pd.concat([self.summary, part]).groupby(keys, dropna=False, sort=False).sum().reset_index()
+        self.summary = part
+        return self
+
+    def _addDose(self, chunk):
+        c = chunk[self.value].values.astype(float)
+        ok = ~np.isnan(c)
+        t = chunk[self.time].values.astype('datetime64[ns]').astype(np.int64)[ok]
+        new = pd.DataFrame({'route': chunk[self.route].values[ok],
+                            'bin': t // pd.Timedelta(self.freq).value,
+                            'value': c[ok]})
+
+        # bins of the carried state can still grow, so max them with the chunk
+        bins = pd.concat([self.doseCarry, new]) if len(self.doseCarry) else new
+        bins = bins.groupby(['route', 'bin'])['value'].max().reset_index()
+        r, b, v = bins['route'].values, bins['bin'].values.astype(np.int64), bins['value'].values
+
+        last = np.r_[r[1:] != r[:-1], True]
+        # a pair is final unless it ends on a route's last (still open) bin
+        final = (r[1:] == r[:-1]) & ~last[1:]
+        pieces = (v[1:] + v[:-1]) / 2 * (b[1:] - b[:-1])
+        self.integral = self.integral.add(pd.Series(pieces[final]).groupby(r[:-1][final]).sum(),
+                                          fill_value=0)
+        first = pd.Series(b).groupby(r).min()
+        self.firstBin = self.firstBin.combine(first, min, fill_value=np.iinfo(np.int64).max)
+
+        # carry the last two bins of every route
+        keep = last | np.r_[last[1:] & (r[1:] == r[:-1]), False]
+        self.doseCarry = bins[keep]
+
+    def _addDwell(self, chunk):
+        new = pd.DataFrame({'route': chunk[self.route].values,
+                            'time': chunk[self.time].values.astype('datetime64[ns]'),
+                            'zone': chunk[self.zone].values})
+        fixes = pd.concat([self.dwellCarry, new]) if len(self.dwellCarry) else new
+        fixes = fixes.sort_values(['route', 'time'], kind='stable', ignore_index=True)
+        r = fixes['route'].values
+
+        dt = fixDurations(r, fixes['time'].values, self.maxGap, self.cadence)
+        last = np.r_[r[1:] != r[:-1], True]
+
+        done = fixes[~last].assign(dt=dt[~last])
+        done = done[done['zone'].isin(self.zones)]
+        seconds = done.groupby(['route', 'zone'])['dt'].sum().unstack()
+        self.dwell = self.dwell.add(seconds.reindex(columns=self.zones), fill_value=0)
+        self.dwellCarry = fixes[last]
+
+    def results(self):
+        '''
+        Combine the partials.
+
+        Returns
+        -------
+        dict
+            'dose', 'dwell' and 'summary' tables, laid out as routeDose(),
+            dwellMatrix() and summaryTable() return them.
+
+        '''
+        step = pd.Timedelta(self.freq).total_seconds() / 60
+
+        # close the pending pair of every route
+        carry = self.doseCarry
+        r, b, v = carry['route'].values, carry['bin'].values.astype(np.int64), carry['value'].values
+        pair = r[1:] == r[:-1]
+        pieces = (v[1:] + v[:-1]) / 2 * (b[1:] - b[:-1])
+        integral = self.integral.add(pd.Series(pieces[pair]).groupby(r[:-1][pair]).sum(),
+                                     fill_value=0)
+        lastBin = pd.Series(b).groupby(r).max()
+        routes = lastBin.index.values
+        integral = integral.reindex(routes, fill_value=0).values * step
+        minTotal = (lastBin.values - self.firstBin.reindex(routes).values) * step
+
+        dose = []
+        for rate in np.atleast_1d(self.rate):
+            total = rate * integral
+            with np.errstate(divide='ignore', invalid='ignore'):
+                doseRate = np.where(minTotal > 0, total / minTotal, np.nan)
+            dose.append(pd.DataFrame({'TotalDose': total, 'Time': minTotal,
+                                      'RouteNumber': routes, 'DoseRate': doseRate,
+                                      'Rate': rate}))
+
+        # the last fix of every route gets the nominal cadence
+        tail = self.dwellCarry[self.dwellCarry['zone'].isin(self.zones)]
+        lastDt = self.cadence if self.maxGap is None else min(self.cadence, self.maxGap)
+        tail = tail.groupby(['route', 'zone']).size().unstack() * float(lastDt)
+        dwell = self.dwell.add(tail.reindex(columns=self.zones), fill_value=0)
+        dwell = dwell.reindex(np.sort(self.dwellCarry['route'].unique()), fill_value=0).fillna(0)
+        dwell.index.name = self.route
+
+        return {'dose': pd.concat(dose, ignore_index=True),
+                'dwell': dwell,
+                'summary': rollup(self.summary, self.strata, self.thresholds, self.route)}
+
+
+def runChunked(file, chunksize=1000000, **kwargs):
+    '''
+    Run the dose, dwell and summary analyses over a CSV in bounded memory.
+
+    Parameters
+    ----------
+    file : Path
+        Tagged traces, e.g. Alldata_tagged.csv.
+    chunksize : int, optional
+        Rows per chunk. The default is 1,000,000.
+    **kwargs :
+        Passed to ChunkedAnalysis.
+
+    Returns
+    -------
+    dict
+        See ChunkedAnalysis.results().
+
+    '''
+    analysis = ChunkedAnalysis(**kwargs)
+    for chunk in pd.read_csv(file, chunksize=chunksize, parse_dates=[analysis.time]):
+        analysis.add(chunk)
+    return analysis.results()
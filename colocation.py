@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Co-location table for the calibration: interval means of every sensor from
+the raw 15 s data, aligned with the BAM reference. Replaces the hand-made
+'Time Series' sheet of Hourly Averages_new.xlsx.
+
+Inputs (CSV, one header row). The default paths `raw` and `bam` below are
+placeholders for where the exports are expected; point them (or the
+--colocation / --bam options of pipeline.py) at the actual files:
+
+    raw   datetime  reading time, 'YYYY-mm-dd HH:MM:SS'
+          sensor    sensor number, 1 to 7 (becomes 'Sensor N')
+          pm25      PM2.5 reading (ug/m3), nominally every 15 s
+    bam   datetime  start of the hour, 'YYYY-mm-dd HH:MM:SS'
+          BAM       hourly BAM PM2.5 (ug/m3)
+
+Times are read as naive timestamps with no timezone conversion, so both files
+must be on the same clock, the local time (UTC+8) the traces are in. An
+hour-ending BAM record has to be shifted back an hour. When either file is
+missing, loadColocation() falls back to the hourly 'Time Series' sheet of
+Hourly Averages_new.xlsx that the regressions read before.
+Created on Sun Oct 18 08:06:53 2026
+"""
+
+import json
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from loader import loadTagged
+from profiling import timed
+
+raw = Path('/Users/jarl/Documents/Observatory/ccarph/Jeepney Data/Collocation_raw.csv')
+bam = Path('/Users/jarl/Documents/Observatory/ccarph/Jeepney Data/BAM_hourly.csv')
+hourly = Path('/Users/jarl/Documents/Observatory/ccarph/Jeepney Data/Hourly Averages_new.xlsx')
+SENSORS = [f'Sensor {i}' for i in range(1, 8)]
+
+
+@timed()
+def sensorMeans(df, freq='1h', time='datetime', sensor='sensor', value='pm25',
+                coverage=0.75, cadence=15):
+    '''
+    Mean of every sensor over fixed intervals, from one grouped pass.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Raw readings of all sensors, with time, sensor and value columns.
+    freq : str, optional
+        Interval length. The default is '1h'.
+    coverage : float, optional
+        Intervals with fewer than this fraction of the expected readings are
+        NaN. The default is 0.75.
+    cadence : num, optional
+        Seconds between readings. The default is 15.
+
+    Returns
+    -------
+    DataFrame
+        Indexed by interval start ('datetime'), one 'Sensor N' column per
+        sensor.
+
+    '''
+    step = pd.Timedelta(freq)
+    t = df[time].values.astype('datetime64[ns]').astype(np.int64)
+    grouped = pd.DataFrame({'sensor': df[sensor].values,
+                            'bin': t // step.value,
+                            'value': df[value].values}).groupby(['sensor', 'bin'])['value']
+
+    means = grouped.mean()
+    means[grouped.count() < coverage * step.total_seconds() / cadence] = np.nan
+
+    table = means.unstack('sensor')
+    table.index = pd.DatetimeIndex(table.index.values * step.value, name='datetime')
+    table.columns = [f'Sensor {s}' for s in table.columns]
+    return table
+
+
+def colocate(df, reference, freq='1h', name='BAM', **kwargs):
+    '''
+    Sensor means aligned with the reference.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Raw readings, see sensorMeans().
+    reference : DataFrame
+        Reference series indexed by time, with a `name` column. It is
+        averaged to `freq` if finer. Intervals are labelled by their start,
+        so an hour-ending BAM record has to be shifted back an hour first.
+    **kwargs :
+        Passed to sensorMeans().
+
+    Returns
+    -------
+    DataFrame
+        'Sensor N' columns and the reference, for the intervals both have.
+
+    '''
+    ref = reference[name].resample(freq).mean()
+    return sensorMeans(df, freq, **kwargs).join(ref, how='inner')
+
+
+def loadHourly(path=hourly):
+    '''
+    The pre-aggregated 'Time Series' sheet the regressions read before:
+    hourly 'Sensor 1' to 'Sensor 7' and BAM columns.
+    '''
+    return pd.read_excel(path, sheet_name='Time Series', usecols=SENSORS + ['BAM'])
+
+
+def loadColocation(raw=raw, bam=bam, freq='1h', fallback=hourly, **kwargs):
+    '''
+    Co-location table, cached as Feather beside the raw data. The cache is
+    rebuilt when either source file or the arguments change.
+
+    Parameters
+    ----------
+    raw : Path, optional
+        Raw co-location readings (datetime, sensor, pm25), see the module
+        docstring.
+    bam : Path, optional
+        BAM record with datetime and BAM columns.
+    freq, **kwargs :
+        See colocate() and sensorMeans().
+    fallback : Path, optional
+        Workbook read with loadHourly() when raw or bam is missing and freq
+        is '1h'. The default is Hourly Averages_new.xlsx.
+
+    Returns
+    -------
+    DataFrame
+        See colocate().
+
+    '''
+    raw, bam = Path(raw), Path(bam)
+    if not (raw.exists() and bam.exists()):
+        if freq != '1h' or fallback is None or not Path(fallback).exists():
+            raise FileNotFoundError(f'no co-location data: {raw} and {bam} are needed')
+        warnings.warn(f'{raw.name} or {bam.name} not found, using the hourly sheet of '
+                      f'{Path(fallback).name}')
+        return loadHourly(fallback)
+    cache = raw.with_name(f'{raw.stem}_{freq}.feather')
+    stamp = {str(f): [f.stat().st_mtime_ns, f.stat().st_size] for f in (raw, bam)}
+    stamp['args'] = json.dumps({'freq': freq, **kwargs}, sort_keys=True)
+
+    meta = cache.with_suffix('.json')
+    if cache.exists() and meta.exists():
+        with open(meta) as f:
+            if json.load(f) == stamp:
+                return feather.read_feather(cache)
+
+    columns = [kwargs.get('time', 'datetime'), kwargs.get('sensor', 'sensor'),
+               kwargs.get('value', 'pm25')]
+    reference = pd.read_csv(bam, parse_dates=['datetime'], index_col='datetime')
+    table = colocate(loadTagged(raw, usecols=columns), reference, freq, **kwargs)
+
+    feather.write_feather(table, cache, compression='uncompressed')
+    with open(meta, 'w') as f:
+        json.dump(stamp, f)
+    return table
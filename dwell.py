@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time spent in each TME for every route, as one route x TME matrix.
+Created on Sun Oct 18 07:57:49 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+from loader import getColumn
+from profiling import timed
+
+TMElist = ['UPTC', 'UP', 'Mcdo', 'Ateneo', 'Miriam', 'Terminal', 'Balara']
+
+
+def fixDurations(routes, times, maxGap=None, cadence=15):
+    '''
+    Seconds represented by each fix: the time until the next fix of the same
+    route.
+
+    Parameters
+    ----------
+    routes : array
+        Route of each fix, sorted by route then time.
+    times : array of datetime64
+        Fix times.
+    maxGap : num, optional
+        Cap in seconds, so a data gap is not counted as dwell. The default
+        is no cap.
+    cadence : num, optional
+        Duration given to the last fix of each route. The default is 15 s.
+
+    Returns
+    -------
+    array of float
+
+    '''
+    t = np.asarray(times).astype('datetime64[ns]').astype(np.int64)
+    dt = np.full(len(t), float(cadence))
+    same = routes[1:] == routes[:-1]
+    dt[:-1][same] = np.diff(t)[same] / 1e9
+    if maxGap is not None:
+        np.minimum(dt, maxGap, out=dt)
+    return dt
+
+
+@timed()
+def dwellMatrix(df, zones=TMElist, maxGap=None, cadence=15, sparse=False,
+                route='Route.Number', zone='TME', time='datetime_fixed'):
+    '''
+    Dwell time (seconds) of every route in every TME, in one grouped pass.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Traces with route, zone and time as columns or index levels.
+    zones : list, optional
+        Columns of the matrix. The default is TMElist.
+    maxGap, cadence :
+        See fixDurations().
+    sparse : bool, optional
+        Return a sparse frame (most routes skip most TMEs). The default is
+        False.
+
+    Returns
+    -------
+    DataFrame
+        Routes x zones, 0 where no time was spent.
+
+    '''
+    r = getColumn(df, route)
+    t = getColumn(df, time)
+    z = getColumn(df, zone)
+
+    order = np.lexsort((t, r))
+    r, t, z = r[order], t[order], z[order]
+    dt = fixDurations(r, t, maxGap, cadence)
+
+    codes = pd.Categorical(z, categories=zones).codes
+    routes, ridx = np.unique(r, return_inverse=True)
+    inZone = codes >= 0
+
+    # one bincount over flattened (route, zone) cells
+    cells = ridx[inZone] * len(zones) + codes[inZone]
+    total = np.bincount(cells, weights=dt[inZone], minlength=len(routes) * len(zones))
+
+    out = pd.DataFrame(total.reshape(len(routes), len(zones)),
+                       index=pd.Index(routes, name=route), columns=zones)
+    if sparse:
+        out = out.astype(pd.SparseDtype(float, 0))
+    return out
@@ -7,62 +7,25 @@ Created on Mon May 30 11:00:55 2022
 @author: jarl
 """
 
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 from pathlib import Path
-from sklearn.linear_model import LinearRegression
-import matplotlib.cm as cm
-import statsmodels.api as sm
+from loader import loadTagged
+from dose import routeDose
+from resultcache import cachedByRoute
+from quality import tripQuality, dropFlagged
 
 data = Path('/Users/jarl/Documents/Observatory/ccarph/Jeepney Data/Alldata_tagged.csv')
 
-df = pd.read_csv(data, usecols=['datetime_fixed', 'calib_pm25', 'Route.Number',
+df = loadTagged(data, usecols=['datetime_fixed', 'calib_pm25', 'Route.Number',
                                 'Longitude', 'Latitude', 'sensor'],
-                 parse_dates=['datetime_fixed'], index_col=['Route.Number', 'datetime_fixed'])
-
-df.drop(index=821, inplace=True)
-
-routeNumbers = list(df.index.get_level_values(0).unique())
-
-def totalDose(routeNo, rate=5.11E-3):
-    '''
-    Estimate the total dose (PM mass [µg]) deposited in the lungs assuming a 
-    specific breathing rate.
-
-    D = r int(C*dt) [m3/min]*[µg/m3]*[15s/(60s * 1 min)]
-
-    Parameters
-    ----------
-    routeNo : int
-        Select the route number over which to integrate.
-    rate : num, optional
-        Breathing rate. The default is sedentary (5.11E-3 m3/min).
-        Optional: light (1.3E-2)
-
-    Returns
-    -------
-    Tuple: total dose (µg) and total time elapsed (minutes)
-
-    '''
-    
-    idf = df.loc[routeNo]
-    idf.resample('15S').max().interpolate(inplace=True) 
-    xpoints = idf.reset_index(drop=True).index.values*(15/60)
-    minTotal = xpoints[-1]
-    
-    return(rate * np.trapz(idf['calib_pm25'], xpoints), minTotal, routeNo)
-
-
-def doseRate(routeNo, rate=5.11E-3):
-    idf = df.loc[routeNo]
-    idf.resample('15S').max().interpolate(inplace=True) 
-    xpoints = idf.reset_index(drop=True).index.values*(15/60)
-    minTotal = xpoints[-1]
-    
-    return (rate * (np.trapz(idf['calib_pm25'], xpoints)/minTotal ), minTotal)
+                index_col=['Route.Number', 'datetime_fixed'])
 
+# trip quality of every route; routes flagged as too short or long, with long
+# gaps, GPS jumps, speed outliers or odd terminal visits are left out
+quality = tripQuality(df)
+df = dropFlagged(df, quality)
 
 def stats(df, ax, use='sklearn'):
     
@@ -71,6 +34,7 @@ def stats(df, ax, use='sklearn'):
     Y = df.iloc[:, 0].values.reshape(-1,1) # -1 means that calculate the dimension of rows, but have 1 column ??? what did i mean by this
     
     if use=='sklearn':
+        from sklearn.linear_model import LinearRegression
         # linear regression: https://scikit-learn.org/stable/modules/generated/sklearn.linear_model.LinearRegression.html
         
         linear_regressor = LinearRegression()  # create object for the class
@@ -87,6 +51,7 @@ def stats(df, ax, use='sklearn'):
         return reg
         
     elif use == 'statsmodel':
+        import statsmodels.api as sm
         x = np.linspace(minTime, int(X.max()), int(X.max())*2)
         
         X = sm.add_constant(X)
@@ -113,8 +78,11 @@ def stats(df, ax, use='sklearn'):
         pass
     
 minTime = 18
-dose1 = pd.DataFrame([totalDose(routeNo) for routeNo in routeNumbers], 
-                    columns=['TotalDose','Time', 'RouteNumber'])
+# dose, trip time and dose rate of every route in one pass; cached per route,
+# so only new or edited routes are recomputed on a rerun
+routedose = cachedByRoute('dose', df, routeDose, {'rate': 5.11E-3})
+dose1 = routedose[['TotalDose','Time', 'RouteNumber']]
+# uncertainty bands of the dose: `python pipeline.py uncertainty`
 # dose = dose[dose['Time'] < 120]
 dose = dose1[(dose1['Time'] < 120) & (dose1['Time'] > minTime)]
 
@@ -132,8 +100,7 @@ est = stats(dose, ax, use='statsmodel')
 #             bbox_inches='tight')
 
 # dose rate
-doserate = pd.DataFrame([doseRate(routeNo) for routeNo in routeNumbers], 
-                    columns=['DoseRate','Time'])
+doserate = routedose[['DoseRate','Time']].copy()
 doserate['Time'] = doserate['Time']/60
 doserate['DoseRate'] = doserate['DoseRate']*60
 doserate = doserate[(doserate['Time'] < 2) & (doserate['Time'] > 0.3)]
@@ -173,13 +140,7 @@ ax2.text(2.05, median+1, f'{round(median,1)}', ha='center', color='red')
 # dose['TotalDose'].describe()
 # doserate['DoseRate'].describe()
 
-# map diagnostics
-weird_routes = dose1[(dose1['Time'] < minTime)].RouteNumber
-for route in weird_routes:
-    cmap = cm.rainbow # starts at purple, ends in red
-    temp_fig, temp_ax = plt.subplots()
-    temp_ax.scatter(df.loc[route].Longitude, df.loc[route].Latitude, c=df.loc[route].reset_index().index, cmap=cmap)
-    triptime = str(dose1[dose1['RouteNumber']==route].Time)
-    temp_ax.text(0.5, 0.5, triptime, ha='center', va='center', transform=temp_ax.transAxes)
-    
-
+# flagged trips, instead of one diagnostic map per route
+flagged = quality[~quality['ok']]
+print(f'{len(flagged)} of {len(quality)} routes flagged')
+print(flagged.drop(columns='ok').to_string())
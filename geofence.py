@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Polygon geofences for the terminal and the TMEs, with a grid index so that
+millions of fixes can be labelled in one call.
+Created on Sun Oct 18 07:54:43 2026
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from profiling import timed
+
+# the terminal box used by routecount.py and routecount_xent.py, as (lon, lat)
+TERMINAL = [(121.072649, 14.630245), (121.075712, 14.630245),
+            (121.075712, 14.633193), (121.072649, 14.633193)]
+
+OUT, IN, EDGE = 0, 1, 2
+
+
+def _edges(rings):
+    '''Stack the edges of all rings as an (k, 4) array of x0, y0, x1, y1.'''
+    edges = []
+    for ring in rings:
+        ring = np.asarray(ring, dtype=float)
+        if not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack([ring, ring[:1]])
+        edges.append(np.hstack([ring[:-1], ring[1:]]))
+    return np.vstack(edges)
+
+
+def _inside(x, y, edges, chunk=200000):
+    '''
+    Even-odd ray casting of points against a set of edges. Holes and
+    multipolygons work as long as every ring is included in `edges`.
+    '''
+    x0, y0, x1, y1 = edges.T
+    out = np.zeros(len(x), dtype=bool)
+    step = max(1, chunk // len(edges))
+    for lo in range(0, len(x), step):
+        px = x[lo:lo+step, None]
+        py = y[lo:lo+step, None]
+        crosses = (y0 > py) != (y1 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xcross = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        out[lo:lo+step] = (crosses & (px < xcross)).sum(axis=1) % 2 == 1
+    return out
+
+
+class Geofence:
+    '''
+    A set of named polygon zones over a regular grid index.
+
+    Every grid cell is classified once per zone as fully outside, fully
+    inside or crossed by the zone boundary. Labelling a point is then an
+    array lookup, and the exact point-in-polygon test only runs for the few
+    points that fall in boundary cells.
+
+    Parameters
+    ----------
+    zones : dict
+        Zone name -> list of rings, each ring a sequence of (lon, lat). A
+        single ring can be passed directly. Earlier zones win where zones
+        overlap.
+    cells : int, optional
+        Number of grid cells along the longer side of the zones' bounds.
+        The default is 256.
+
+    '''
+
+    def __init__(self, zones, cells=256):
+        self.names = list(zones)
+        self.edges = []
+        for name in self.names:
+            rings = zones[name]
+            if np.ndim(rings[0]) == 1:  # a single ring
+                rings = [rings]
+            self.edges.append(_edges(rings))
+
+        allEdges = np.vstack(self.edges)
+        self.xmin = min(allEdges[:, 0].min(), allEdges[:, 2].min())
+        self.xmax = max(allEdges[:, 0].max(), allEdges[:, 2].max())
+        self.ymin = min(allEdges[:, 1].min(), allEdges[:, 3].min())
+        self.ymax = max(allEdges[:, 1].max(), allEdges[:, 3].max())
+        self.size = max(self.xmax - self.xmin, self.ymax - self.ymin) / cells
+        self.nx = int(np.ceil((self.xmax - self.xmin) / self.size)) + 1
+        self.ny = int(np.ceil((self.ymax - self.ymin) / self.size)) + 1
+
+        self.grid = np.zeros((len(self.names), self.ny, self.nx), dtype=np.uint8)
+        cx = self.xmin + (np.arange(self.nx) + 0.5) * self.size
+        cy = self.ymin + (np.arange(self.ny) + 0.5) * self.size
+        gx, gy = np.meshgrid(cx, cy)
+        for z, edges in enumerate(self.edges):
+            inside = _inside(gx.ravel(), gy.ravel(), edges).reshape(self.ny, self.nx)
+            self.grid[z][inside] = IN
+            # any cell touched by an edge's bounding box needs the exact test
+            ix0, iy0 = self._cell(np.minimum(edges[:, 0], edges[:, 2]),
+                                  np.minimum(edges[:, 1], edges[:, 3]))
+            ix1, iy1 = self._cell(np.maximum(edges[:, 0], edges[:, 2]),
+                                  np.maximum(edges[:, 1], edges[:, 3]))
+            for a, b, c, d in zip(ix0, ix1, iy0, iy1):
+                self.grid[z, c:d+1, a:b+1] = EDGE
+
+    @classmethod
+    def fromGeoJSON(cls, path, name='name', **kwargs):
+        '''
+        Load zones from a GeoJSON FeatureCollection of (Multi)Polygons.
+
+        Parameters
+        ----------
+        path : Path
+            GeoJSON file in WGS84.
+        name : str, optional
+            Feature property holding the zone name. The default is 'name'.
+
+        '''
+        with open(path) as f:
+            features = json.load(f)['features']
+
+        zones = {}
+        for feature in features:
+            geom = feature['geometry']
+            polys = geom['coordinates']
+            if geom['type'] == 'Polygon':
+                polys = [polys]
+            rings = [ring for poly in polys for ring in poly]
+            zones.setdefault(feature['properties'][name], []).extend(rings)
+
+        return cls(zones, **kwargs)
+
+    def _cell(self, x, y):
+        ix = np.clip(((x - self.xmin) / self.size).astype(int), 0, self.nx - 1)
+        iy = np.clip(((y - self.ymin) / self.size).astype(int), 0, self.ny - 1)
+        return ix, iy
+
+    @timed('geofence', rows=1)
+    def membership(self, lon, lat):
+        '''
+        Zone membership of every point.
+
+        Parameters
+        ----------
+        lon, lat : array
+            Point coordinates.
+
+        Returns
+        -------
+        array of bool, shape (n points, n zones)
+
+        '''
+        x = np.asarray(lon, dtype=float)
+        y = np.asarray(lat, dtype=float)
+        member = np.zeros((len(x), len(self.names)), dtype=bool)
+
+        bounded = ((x >= self.xmin) & (x <= self.xmax)
+                   & (y >= self.ymin) & (y <= self.ymax))
+        idx = np.flatnonzero(bounded)
+        ix, iy = self._cell(x[idx], y[idx])
+
+        for z, edges in enumerate(self.edges):
+            state = self.grid[z, iy, ix]
+            member[idx[state == IN], z] = True
+            check = idx[state == EDGE]
+            member[check, z] = _inside(x[check], y[check], edges)
+
+        return member
+
+    def contains(self, lon, lat):
+        '''True for points inside any of the zones.'''
+        return self.membership(lon, lat).any(axis=1)
+
+    def label(self, lon, lat):
+        '''
+        Name of the zone each point falls in.
+
+        Returns
+        -------
+        Categorical
+            Zone names, NaN outside every zone.
+
+        '''
+        member = self.membership(lon, lat)
+        codes = np.where(member.any(axis=1), member.argmax(axis=1), -1)
+        return pd.Categorical.from_codes(codes, categories=self.names)
+
+
+terminal = Geofence({'Terminal': TERMINAL})
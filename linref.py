@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Linear referencing along the UP-Katipunan route. Every fix is snapped to the
+nearest segment of a reference polyline (KD-tree over the segments, then an
+exact projection), giving its distance along the route and its offset from
+it, so circuits can be compared at the same point of the route.
+Created on Sun Oct 18 08:10:47 2026
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from binning import DEG
+from loader import getColumn
+from profiling import timed
+
+
+class RouteLine:
+    '''
+    Reference polyline of the route, in local metres.
+
+    Parameters
+    ----------
+    lon, lat : array
+        Vertices in travel order (WGS84). For the loop, start and end at
+        the terminal.
+    spacing : num, optional
+        Segments are split to at most this length (m) before indexing, so
+        the nearest segment midpoints always include the nearest segment.
+        The default is 10.
+
+    '''
+
+    def __init__(self, lon, lat, spacing=10):
+        lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+        self.lon0, self.lat0 = lon.mean(), lat.mean()
+        x, y = self._project(lon, lat)
+
+        keep = np.r_[True, (np.diff(x) != 0) | (np.diff(y) != 0)]
+        x, y = x[keep], y[keep]
+        pieces = np.maximum(np.ceil(np.hypot(np.diff(x), np.diff(y)) / spacing), 1).astype(int)
+        seg = np.repeat(np.arange(len(pieces)), pieces)
+        frac = np.arange(len(seg)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        frac = frac / pieces[seg]
+        self.x = np.r_[x[seg] + frac * (x[seg + 1] - x[seg]), x[-1]]
+        self.y = np.r_[y[seg] + frac * (y[seg + 1] - y[seg]), y[-1]]
+
+        self.dx, self.dy = np.diff(self.x), np.diff(self.y)
+        self.seglen = np.hypot(self.dx, self.dy)
+        self.s = np.r_[0, np.cumsum(self.seglen)]
+        self._tree = None
+
+    @property
+    def length(self):
+        '''Length of the route (m).'''
+        return self.s[-1]
+
+    def _project(self, lon, lat):
+        x = (np.asarray(lon) - self.lon0) * DEG * np.cos(np.radians(self.lat0))
+        y = (np.asarray(lat) - self.lat0) * DEG
+        return x, y
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            mid = np.c_[self.x[:-1] + self.dx / 2, self.y[:-1] + self.dy / 2]
+            self._tree = cKDTree(mid)
+        return self._tree
+
+    @classmethod
+    def fromGeoJSON(cls, path, **kwargs):
+        '''Load the first LineString of a GeoJSON file (WGS84).'''
+        with open(path) as f:
+            data = json.load(f)
+        features = data.get('features', [data])
+        for feature in features:
+            geom = feature.get('geometry', feature)
+            if geom['type'] == 'LineString':
+                lon, lat = np.array(geom['coordinates'])[:, :2].T
+                return cls(lon, lat, **kwargs)
+        raise ValueError(f'no LineString in {path}')
+
+    @classmethod
+    def fromTraces(cls, df, route='Route.Number', time='datetime_fixed', window=9,
+                   step=20, **kwargs):
+        '''
+        Build the line from the fixes of one typical circuit: the one with
+        the median number of fixes, smoothed with a running median of
+        `window` fixes and thinned to vertices at least `step` m apart.
+        '''
+        r = getColumn(df, route)
+        sizes = pd.Series(r).value_counts()
+        typical = sizes.index[np.argsort(sizes.values)[len(sizes) // 2]]
+        one = pd.DataFrame({'t': getColumn(df, time), 'lon': df['Longitude'].values,
+                            'lat': df['Latitude'].values})[r == typical].sort_values('t')
+        one = one[['lon', 'lat']].rolling(window, center=True, min_periods=1).median()
+
+        lon, lat = one['lon'].values, one['lat'].values
+        keep, last = [0], 0
+        scale = DEG * np.cos(np.radians(lat.mean()))
+        for i in range(1, len(lon)):
+            if np.hypot((lon[i] - lon[last]) * scale, (lat[i] - lat[last]) * DEG) >= step:
+                keep.append(i)
+                last = i
+        return cls(lon[keep], lat[keep], **kwargs)
+
+    def toGeoJSON(self, path):
+        '''Write the (densified) line as a GeoJSON LineString.'''
+        lon, lat = self.lonlat(self.s)
+        feature = {'type': 'Feature', 'properties': {'length': self.length},
+                   'geometry': {'type': 'LineString',
+                                'coordinates': np.c_[lon, lat].round(7).tolist()}}
+        with open(path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': [feature]}, f)
+
+    def lonlat(self, distance):
+        '''Coordinates of points at the given distances along the route.'''
+        x = np.interp(distance, self.s, self.x)
+        y = np.interp(distance, self.s, self.y)
+        return (x / (DEG * np.cos(np.radians(self.lat0))) + self.lon0, y / DEG + self.lat0)
+
+    @timed('linref', rows=1)
+    def snap(self, lon, lat, k=4, chunk=500000):
+        '''
+        Snap fixes to the line.
+
+        Parameters
+        ----------
+        lon, lat : array
+            Fix coordinates.
+        k : int, optional
+            Candidate segments per fix (nearest midpoints). The default is 4.
+        chunk : int, optional
+            Fixes processed at once, to bound memory. The default is 500,000.
+
+        Returns
+        -------
+        distance : array
+            Distance along the route of the snapped point (m).
+        offset : array
+            Distance from the route (m); positive to the left of the
+            direction of travel.
+
+        '''
+        px, py = self._project(lon, lat)
+        distance = np.full(len(px), np.nan)
+        offset = np.full(len(px), np.nan)
+        k = min(k, len(self.seglen))
+
+        for start in range(0, len(px), chunk):
+            x, y = px[start:start+chunk], py[start:start+chunk]
+            ok = ~(np.isnan(x) | np.isnan(y))
+            x, y = x[ok, None], y[ok, None]
+            _, idx = self.tree.query(np.c_[x, y], k=k)
+            idx = idx.reshape(len(x), k)
+
+            ax, ay, dx, dy = self.x[idx], self.y[idx], self.dx[idx], self.dy[idx]
+            t = np.clip(((x - ax) * dx + (y - ay) * dy) / self.seglen[idx]**2, 0, 1)
+            d2 = (ax + t * dx - x)**2 + (ay + t * dy - y)**2
+            best = np.argmin(d2, axis=1)
+            rows = np.arange(len(x))
+            i, t = idx[rows, best], t[rows, best]
+
+            side = np.sign(dx[rows, best] * (y[:, 0] - ay[rows, best])
+                           - dy[rows, best] * (x[:, 0] - ax[rows, best]))
+            sl = slice(start, start + len(ok))
+            distance[sl][ok] = self.s[i] + t * self.seglen[i]
+            offset[sl][ok] = np.sqrt(d2[rows, best]) * np.where(side == 0, 1, side)
+
+        return distance, offset
+
+
+def alongProfile(df, line, step=50, maxOffset=50, value='calib_pm25', route='Route.Number'):
+    '''
+    PM2.5 along the route, pooled over every circuit.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Traces with Longitude, Latitude, the value and route.
+    line : RouteLine
+        Reference line.
+    step : num, optional
+        Length of the route bins (m). The default is 50.
+    maxOffset : num, optional
+        Fixes further than this from the line (m) are left out. The
+        default is 50.
+
+    Returns
+    -------
+    DataFrame
+        One row per bin: start, centre (Longitude/Latitude), count,
+        circuits, mean, median, q25 and q75.
+
+    '''
+    distance, offset = line.snap(df['Longitude'].values, df['Latitude'].values)
+    c = df[value].values.astype(float)
+    ok = (np.abs(offset) <= maxOffset) & ~np.isnan(c)
+
+    fixes = pd.DataFrame({'bin': (distance[ok] // step).astype(np.int64),
+                          'route': getColumn(df, route)[ok], 'value': c[ok]})
+    grouped = fixes.groupby('bin')
+    profile = pd.DataFrame({'count': grouped.size(),
+                            'circuits': grouped['route'].nunique(),
+                            'mean': grouped['value'].mean(),
+                            'median': grouped['value'].median(),
+                            'q25': grouped['value'].quantile(0.25),
+                            'q75': grouped['value'].quantile(0.75)})
+    profile.insert(0, 'distance', profile.index.values * step)
+    profile['Longitude'], profile['Latitude'] = line.lonlat(profile['distance'].values + step / 2)
+    return profile.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import sys
+    from loader import loadTagged
+
+    # python linref.py Alldata_tagged.csv profile.csv [route.geojson]
+    df = loadTagged(sys.argv[1], usecols=['Longitude', 'Latitude', 'calib_pm25',
+                                          'Route.Number', 'datetime_fixed'])
+    if len(sys.argv) > 3:
+        line = RouteLine.fromGeoJSON(sys.argv[3])
+    else:
+        line = RouteLine.fromTraces(df)
+    print(f'route length {line.length:.0f} m')
+    alongProfile(df, line).to_csv(sys.argv[2], index=False)
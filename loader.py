@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared loader for Alldata_tagged.csv. The CSV is parsed once into a Feather
+(Arrow IPC) file next to it, and every script reads only the columns it needs
+from the memory-mapped copy.
+Created on Sun Oct 18 07:52:37 2026
+"""
+
+import json
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from profiling import timed
+
+data = Path('/Users/jarl/Documents/Observatory/ccarph/Jeepney Data/Alldata_tagged.csv')
+
+# columns that hold timestamps in the tagged data; parsed once when caching
+DATE_COLUMNS = ['datetime_fixed', 'datetime']
+
+
+def cachePath(file):
+    '''
+    Location of the columnar copy of a CSV file.
+
+    Parameters
+    ----------
+    file : Path
+        Source CSV.
+
+    Returns
+    -------
+    Path
+        Feather file stored beside the CSV.
+
+    '''
+    file = Path(file)
+    return file.with_suffix('.feather')
+
+
+def _stamp(file):
+    stat = Path(file).stat()
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def isFresh(file):
+    '''
+    Check whether the cached copy still matches the source CSV.
+
+    The size and modification time of the CSV are recorded in a small JSON
+    sidecar when the cache is written; any change to either invalidates it.
+
+    '''
+    cache = cachePath(file)
+    meta = cache.with_suffix('.json')
+    if not (cache.exists() and meta.exists()):
+        return False
+    with open(meta) as f:
+        return json.load(f) == _stamp(file)
+
+
+@timed()
+def buildCache(file):
+    '''
+    Parse the whole CSV once and write it as an uncompressed Feather file so
+    it can be memory-mapped on read.
+
+    Parameters
+    ----------
+    file : Path
+        Source CSV.
+
+    Returns
+    -------
+    Path
+        The cache file.
+
+    '''
+    file = Path(file)
+    cache = cachePath(file)
+
+    df = pd.read_csv(file)
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+
+    # object columns with few distinct values (TME, Day, Timegroup...) are
+    # stored as dictionaries instead of repeated strings
+    for col in df.select_dtypes(include='object').columns:
+        if df[col].nunique() < len(df) / 2:
+            df[col] = df[col].astype('category')
+
+    feather.write_feather(df, cache, compression='uncompressed')
+    with open(cache.with_suffix('.json'), 'w') as f:
+        json.dump(_stamp(file), f)
+
+    return cache
+
+
+def getColumn(df, name):
+    '''Get a column or an index level of df by name, as an array.'''
+    if name in df.columns:
+        return df[name].values
+    return df.index.get_level_values(name).values
+
+
+@timed(rows='out')
+def loadTagged(file=data, usecols=None, index_col=None):
+    '''
+    Load the tagged jeepney data, (re)building the columnar cache if needed.
+
+    Parameters
+    ----------
+    file : Path, optional
+        Source CSV. The default is Alldata_tagged.csv.
+    usecols : list, optional
+        Columns to read. The default reads everything.
+    index_col : str or list, optional
+        Column(s) to set as the index, as in pd.read_csv.
+
+    Returns
+    -------
+    df : DataFrame
+        Date columns are already datetime64.
+
+    '''
+    if not isFresh(file):
+        buildCache(file)
+
+    columns = None
+    if usecols is not None:
+        columns = list(usecols)
+        if index_col is not None:
+            extra = [index_col] if isinstance(index_col, str) else index_col
+            columns += [c for c in extra if c not in columns]
+
+    table = feather.read_table(cachePath(file), columns=columns, memory_map=True)
+    df = table.to_pandas()
+
+    if index_col is not None:
+        df.set_index(index_col, inplace=True)
+
+    return df
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo uncertainty of the inhaled dose. Breathing rates and calibration
+parameters are drawn once, and the dose of every route under every draw is
+evaluated as a (routes x draws) array, in route chunks so memory stays
+bounded, optionally spread over worker processes.
+Created on Sun Oct 18 08:14:05 2026
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dose import SEDENTARY, LIGHT
+from profiling import timed
+
+PERCENTILES = [2.5, 50, 97.5]
+
+
+def _chunk(integral, time, group, rates, slope, intercept, m0, b0, percentiles):
+    '''
+    Dose of some routes under all draws.
+
+    The traces were calibrated with (m0, b0), i.e. calib = (raw - b0) / m0,
+    so recalibrating with a drawn (m, b) gives (m0*calib + b0 - b) / m and,
+    integrated over the route, rate * (m0*I + (b0 - b)*T) / m.
+    '''
+    m = slope[group]
+    dose = rates * (m0[group, None] * integral[:, None]
+                    + (b0[group, None] - intercept[group]) * time[:, None]) / m
+    with np.errstate(divide='ignore', invalid='ignore'):
+        doseRate = dose / time[:, None] * 60
+    return (np.percentile(dose, percentiles, axis=1).T,
+            np.percentile(doseRate, percentiles, axis=1).T,
+            dose.sum(axis=0), np.where(np.isfinite(doseRate), doseRate, 0).sum(axis=0),
+            np.isfinite(doseRate).sum(axis=0))
+
+
+@timed()
+def monteCarloDose(routedose, n=10000, rate=(SEDENTARY, LIGHT), calibration=None, sensors=None,
+                   percentiles=PERCENTILES, seed=None, chunk=500, processes=None):
+    '''
+    Percentile bands of the dose of every route and of the fleet.
+
+    Parameters
+    ----------
+    routedose : DataFrame
+        From routeDose(), for a single rate. Dose is linear in the rate, so
+        TotalDose / Rate is the route's concentration integral.
+    n : int, optional
+        Number of draws. The default is 10,000.
+    rate : num or (lo, hi), optional
+        Breathing rate (m3/min), fixed or drawn uniformly between lo and hi.
+        The default is sedentary to light activity.
+    calibration : DataFrame, optional
+        From calibrate(): slope, intercept, slope_se, intercept_se and
+        slope_intercept_cov per sensor, the fit the traces were calibrated
+        with. Slope and intercept are drawn together from the bivariate
+        normal of the fit, one draw per sensor shared by all its routes,
+        with slopes kept above 1/1000 of the fit. The slope of every sensor
+        used must be positive. The default is no calibration uncertainty.
+    sensors : array, optional
+        Calibration index (e.g. 'Sensor 3') of every route in routedose.
+        Needed with calibration; with a single sensor in calibration it can
+        be omitted.
+    percentiles : list, optional
+        The default is 2.5, 50 and 97.5.
+    seed : int, optional
+        Seed of the draws.
+    chunk : int, optional
+        Routes evaluated at once; memory is about chunk * n * 16 bytes. The
+        default is 500.
+    processes : int, optional
+        Spread the chunks over this many worker processes. The default is
+        to run in this process.
+
+    Returns
+    -------
+    routes : DataFrame
+        RouteNumber, Time and dose_p<q> / rate_p<q> (µg, µg/hr) for every
+        percentile.
+    fleet : DataFrame
+        Percentiles of the fleet mean dose and dose rate over the draws,
+        indexed by percentile.
+
+    '''
+    rng = np.random.default_rng(seed)
+    integral = (routedose['TotalDose'] / routedose['Rate']).values.astype(float)
+    time = routedose['Time'].values.astype(float)
+
+    if np.ndim(rate) == 0:
+        rates = np.full(n, float(rate))
+    else:
+        rates = rng.uniform(rate[0], rate[1], n)
+
+    if calibration is None:
+        m0, b0 = np.ones(1), np.zeros(1)
+        slope, intercept = np.ones((1, n)), np.zeros((1, n))
+        group = np.zeros(len(time), dtype=int)
+    else:
+        if sensors is None:
+            if len(calibration) > 1:
+                raise ValueError('sensors is needed with more than one calibration')
+            sensors = np.repeat(calibration.index[0], len(time))
+        group = calibration.index.get_indexer(np.asarray(sensors))
+        if (group < 0).any():
+            missing = sorted(set(map(str, np.asarray(sensors)[group < 0])))
+            raise ValueError(f'no calibration for {", ".join(missing)}')
+        m0 = calibration['slope'].values.astype(float)
+        b0 = calibration['intercept'].values.astype(float)
+        bad = np.unique(group[m0[group] <= 0])
+        if len(bad):
+            names = ', '.join(map(str, calibration.index[bad]))
+            raise ValueError(f'non-positive calibration slope for {names}')
+        sm = calibration['slope_se'].values.astype(float)
+        sb = calibration['intercept_se'].values.astype(float)
+        cov = calibration['slope_intercept_cov'].values.astype(float)
+        # (m, b) from the bivariate normal of the fit: the part of b along
+        # the slope draw carries their covariance, the rest is independent
+        with np.errstate(divide='ignore', invalid='ignore'):
+            along = np.where(sm > 0, cov / sm, 0)
+        rest = np.sqrt(np.clip(sb**2 - along**2, 0, None))
+        z = rng.standard_normal((2, len(calibration), n))
+        slope = m0[:, None] + sm[:, None] * z[0]
+        intercept = b0[:, None] + along[:, None] * z[0] + rest[:, None] * z[1]
+        # a non-positive slope has no meaning as a calibration; the fitted
+        # slopes are positive, so this floor is too
+        slope = np.maximum(slope, 1e-3 * m0[:, None])
+
+    bounds = range(0, len(time), chunk)
+    args = [(integral[i:i+chunk], time[i:i+chunk], group[i:i+chunk], rates, slope, intercept,
+             m0, b0, percentiles) for i in bounds]
+    if processes:
+        with ProcessPoolExecutor(processes) as pool:
+            parts = list(pool.map(_chunk, *zip(*args)))
+    else:
+        parts = [_chunk(*a) for a in args]
+
+    doseP = np.concatenate([p[0] for p in parts])
+    rateP = np.concatenate([p[1] for p in parts])
+    fleetDose = sum(p[2] for p in parts) / len(time)
+    fleetRate = sum(p[3] for p in parts) / sum(p[4] for p in parts)
+
+    names = [f'{q:g}' for q in percentiles]
+    routes = pd.DataFrame({'RouteNumber': routedose['RouteNumber'].values, 'Time': time})
+    for i, q in enumerate(names):
+        routes[f'dose_p{q}'] = doseP[:, i]
+    for i, q in enumerate(names):
+        routes[f'rate_p{q}'] = rateP[:, i]
+
+    fleet = pd.DataFrame({'dose': np.percentile(fleetDose, percentiles),
+                          'rate': np.percentile(fleetRate, percentiles)},
+                         index=pd.Index(percentiles, name='percentile'))
+    return routes, fleet
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run the whole analysis from one command. The stages form a dependency graph
+
+    load -> segment -> quality -> dose, dwell, summary, grid, binning -> figures
+    regression (co-location data, independent of the traces)
+    dose, regression -> uncertainty
+
+and every stage whose dependencies are done is started at once in a pool of
+worker processes. Stages hand data to each other through files in the output
+directory, so a worker only reads the columns it needs. Routes flagged by the
+quality stage are left out of everything downstream.
+
+    python pipeline.py --data Alldata_tagged.csv --out results
+    python pipeline.py dose dwell --workers 2    # only these and their deps
+
+Created on Sun Oct 18 08:08:48 2026
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import pandas as pd
+
+import loader
+from profiling import profiler, stage
+
+
+def _segmented(cfg, columns):
+    '''Columns of the traces written by the segment stage.'''
+    import pyarrow.feather as feather
+    return feather.read_table(Path(cfg.out)/'segmented.feather', columns=columns,
+                              memory_map=True).to_pandas()
+
+
+def _traces(cfg, columns):
+    '''
+    Like _segmented(), without the routes flagged by the quality stage
+    (unless --keep-flagged).
+    '''
+    from quality import dropFlagged
+
+    df = _segmented(cfg, columns if 'Route.Number' in columns else columns + ['Route.Number'])
+    if not cfg.keep_flagged:
+        flags = pd.read_csv(Path(cfg.out)/'quality.csv', index_col='Route.Number')
+        df = dropFlagged(df, flags)
+    return df[columns]
+
+
+def load(cfg):
+    '''Build (or reuse) the columnar cache of the tagged CSV.'''
+    if not loader.isFresh(cfg.data):
+        loader.buildCache(cfg.data)
+    return loader.cachePath(cfg.data)
+
+
+def segment(cfg):
+    '''
+    Traces sorted by sensor and time, with InTerminal and (with --resegment)
+    Route.Number recomputed from the terminal geofence.
+    '''
+    import pyarrow.feather as feather
+    from geofence import terminal
+    from segment import segmentRoutes
+
+    df = loader.loadTagged(cfg.data)
+    df.sort_values(['sensor', 'datetime_fixed'], kind='stable', inplace=True, ignore_index=True)
+    df['InTerminal'] = terminal.contains(df['Longitude'].values, df['Latitude'].values)
+    if cfg.resegment:
+        df['Route.Number'] = segmentRoutes(df['datetime_fixed'].values, df['InTerminal'].values,
+                                           df['sensor'].values)
+    out = Path(cfg.out)/'segmented.feather'
+    feather.write_feather(df, out, compression='uncompressed')
+    return out
+
+
+def quality(cfg):
+    '''Trip-quality metrics and flags of every route.'''
+    from quality import tripQuality
+    df = _segmented(cfg, ['Route.Number', 'datetime_fixed', 'Longitude', 'Latitude',
+                          'InTerminal'])
+    out = Path(cfg.out)/'quality.csv'
+    tripQuality(df).to_csv(out)
+    return out
+
+
+def dose(cfg):
+    from dose import routeDose, SEDENTARY
+    df = _traces(cfg, ['Route.Number', 'datetime_fixed', 'calib_pm25'])
+    out = Path(cfg.out)/'dose.csv'
+    routeDose(df, rate=SEDENTARY).to_csv(out, index=False)
+    return out
+
+
+def dwell(cfg):
+    from dwell import dwellMatrix
+    df = _traces(cfg, ['Route.Number', 'datetime_fixed', 'TME'])
+    out = Path(cfg.out)/'dwell.csv'
+    dwellMatrix(df, maxGap=60).to_csv(out)
+    return out
+
+
+def summary(cfg):
+    from summary import summaryTable
+    df = _traces(cfg, ['Route.Number', 'calib_pm25', 'Day', 'Timegroup', 'Hour'])
+    out = Path(cfg.out)/'summary.csv'
+    summaryTable(df).to_csv(out, index=False)
+    return out
+
+
+def binning(cfg):
+    '''The *_SpatiallyGrouped layers the figures are drawn from.'''
+    from binning import binTraces, writeLayers
+    df = _traces(cfg, ['Longitude', 'Latitude', 'calib_pm25', 'Day', 'Timegroup', 'Hour'])
+    out = Path(cfg.out)/'layers'
+    writeLayers(binTraces(df, cfg.size, cfg.shape), out)
+    return out
+
+
+def grid(cfg):
+    '''All sensors on the common 15 s grid, with the gap mask (npz).'''
+    import numpy as np
+    from regrid import sensorGrid
+    df = _traces(cfg, ['sensor', 'datetime_fixed', 'calib_pm25'])
+    sensors, times, values, gap = sensorGrid(df, maxGap=cfg.max_gap)
+    out = Path(cfg.out)/'sensor_grid.npz'
+    np.savez(out, sensors=sensors, times=times, grid=values, gap=gap)
+    return out
+
+
+def regression(cfg):
+    '''Calibration fits against the BAM; skipped without --colocation.'''
+    if cfg.colocation is None:
+        return None
+    from calibration import calibrate
+    from colocation import loadColocation
+    out = Path(cfg.out)/'calibration.csv'
+    calibrate(loadColocation(cfg.colocation, cfg.bam).dropna(), reference='BAM').to_csv(out)
+    return out
+
+
+def uncertainty(cfg):
+    '''
+    Monte Carlo dose bands over breathing rates and, when the regression
+    ran, the calibration fits of each route's sensor.
+    '''
+    from montecarlo import monteCarloDose
+    routedose = pd.read_csv(cfg.inputs['dose'])
+    calibration = sensors = None
+    # only the fits of this run's regression stage, never a file left behind
+    if cfg.inputs['regression'] is not None:
+        calibration = pd.read_csv(cfg.inputs['regression'], index_col=0)
+        first = _segmented(cfg, ['Route.Number', 'sensor']).groupby('Route.Number')['sensor'].first()
+        sensors = [f'Sensor {int(s)}' for s in first.reindex(routedose['RouteNumber']).values]
+    routes, fleet = monteCarloDose(routedose, n=cfg.draws, calibration=calibration,
+                                   sensors=sensors, seed=0)
+    out = Path(cfg.out)/'dose_uncertainty.csv'
+    routes.to_csv(out, index=False)
+    fleet.to_csv(Path(cfg.out)/'dose_uncertainty_fleet.csv')
+    return out
+
+
+def figures(cfg):
+    from spatiotemporal import render_batch
+    out = Path(cfg.out)/'figures'
+    render_batch(Path(cfg.out)/'layers', out, processes=cfg.workers)
+    return out
+
+
+# stage -> (function, stages it needs)
+STAGES = {'load': (load, []),
+          'segment': (segment, ['load']),
+          'quality': (quality, ['segment']),
+          'dose': (dose, ['quality']),
+          'dwell': (dwell, ['quality']),
+          'summary': (summary, ['quality']),
+          'binning': (binning, ['quality']),
+          'grid': (grid, ['quality']),
+          'regression': (regression, []),
+          'uncertainty': (uncertainty, ['dose', 'regression']),
+          'figures': (figures, ['binning'])}
+
+
+def _needed(targets):
+    '''The targets and everything they depend on.'''
+    needed, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in STAGES:
+            raise ValueError(f'unknown stage {name!r}, choose from {list(STAGES)}')
+        if name not in needed:
+            needed.add(name)
+            todo += STAGES[name][1]
+    return needed
+
+
+def _run(name, cfg):
+    start = len(profiler.records)
+    with stage(name):
+        out = STAGES[name][0](cfg)
+    return out, profiler.records[start:]
+
+
+def run(cfg, targets=None):
+    '''
+    Run the targets (default: every stage) and their dependencies, each one
+    as soon as its dependencies have finished.
+
+    Parameters
+    ----------
+    cfg : Namespace
+        data, out, colocation, bam, resegment, keep_flagged, max_gap, draws,
+        size, shape and workers, as given on the command line. Each stage
+        gets a copy with `inputs`, the outputs of the stages it needs.
+    targets : list, optional
+        Stages wanted. The default is all of them.
+
+    Returns
+    -------
+    DataFrame
+        One row per stage run in the workers (with the analysis steps nested
+        under it): depth, rows, seconds, cpu_seconds and maxrss_mb.
+
+    '''
+    pending = _needed(targets or list(STAGES))
+    Path(cfg.out).mkdir(parents=True, exist_ok=True)
+    done, running, records = {}, {}, []
+
+    with ProcessPoolExecutor(cfg.workers) as pool:
+        while pending or running:
+            for name in [n for n in pending if all(d in done for d in STAGES[n][1])]:
+                pending.remove(name)
+                # each stage sees the outputs of the stages it needs as cfg.inputs
+                inputs = {d: done[d] for d in STAGES[name][1]}
+                stageCfg = argparse.Namespace(**vars(cfg), inputs=inputs)
+                running[pool.submit(_run, name, stageCfg)] = name
+                print(f'started {name}')
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for job in finished:
+                name = running.pop(job)
+                done[name], stages = job.result()
+                records += stages
+                print(f'finished {name} -> {done[name]}')
+
+    return pd.DataFrame(records, columns=['stage', 'depth', 'rows', 'seconds',
+                                          'cpu_seconds', 'maxrss_mb'])
+
+
+def parse(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('targets', nargs='*', help=f'stages to run (default all): {", ".join(STAGES)}')
+    parser.add_argument('--data', type=Path, default=loader.data, help='tagged traces CSV')
+    parser.add_argument('--out', type=Path, default=Path('results'), help='output directory')
+    parser.add_argument('--colocation', type=Path, help='raw co-location readings for the regression')
+    parser.add_argument('--bam', type=Path, help='BAM record for the regression')
+    parser.add_argument('--resegment', action='store_true',
+                        help='recompute Route.Number from the terminal geofence')
+    parser.add_argument('--keep-flagged', action='store_true',
+                        help='keep the routes flagged by the quality stage')
+    parser.add_argument('--max-gap', type=float, default=60,
+                        help='longest gap bridged on the sensor grid (s)')
+    parser.add_argument('--draws', type=int, default=10000,
+                        help='Monte Carlo draws for the dose uncertainty')
+    parser.add_argument('--size', type=float, default=50, help='map bin size (m)')
+    parser.add_argument('--shape', choices=['square', 'hex'], default='square')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    cfg = parse()
+    if cfg.colocation is not None and cfg.bam is None:
+        import colocation
+        cfg.bam = colocation.bam
+
+    start = time.perf_counter()
+    report = run(cfg, cfg.targets)
+    report.to_csv(cfg.out/'profile.csv', index=False)
+    print(report.round(3).to_string(index=False))
+    print(f'total {time.perf_counter() - start:.1f} s')
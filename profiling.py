@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stage-level instrumentation: wall time, CPU time, rows and peak RSS of every
+analysis step, with an optional cProfile dump of chosen stages.
+
+The analysis functions are decorated with timed(), so every script is
+instrumented. Set PM25_PROFILE to a .json or .csv path to have the report
+written when the script exits, and PM25_CPROFILE to a comma-separated list
+of stages to cProfile. Or run a script through this module:
+
+    python profiling.py exposure.py --out exposure.json --cprofile routeDose
+
+Created on Sun Oct 18 08:07:54 2026
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def peakRSS():
+    '''Peak resident set size of the process so far, in MB.'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kB on Linux
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 1024
+
+
+class Profiler:
+    '''
+    Records one row per stage run.
+
+    Parameters
+    ----------
+    cprofile : list, optional
+        Stage names to run under cProfile. Repeated runs of a stage are
+        accumulated into one profile.
+
+    '''
+
+    def __init__(self, cprofile=()):
+        self.records = []
+        self.cprofile = set(cprofile)
+        self.profiles = {}
+        self._depth = 0
+        self._profiling = False
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        '''
+        Time the enclosed block.
+
+        Yields the record, so rows can be filled in once they are known:
+
+            with profiler.stage('load') as rec:
+                df = ...
+                rec['rows'] = len(df)
+
+        '''
+        rec = {'stage': name, 'depth': self._depth, 'rows': rows}
+        prof = None
+        if name in self.cprofile and not self._profiling:
+            prof = self.profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            prof.enable()
+
+        self._depth += 1
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield rec
+        finally:
+            rec['seconds'] = time.perf_counter() - wall
+            rec['cpu_seconds'] = time.process_time() - cpu
+            rec['maxrss_mb'] = peakRSS()
+            self._depth -= 1
+            if prof is not None:
+                prof.disable()
+                self._profiling = False
+            self.records.append(rec)
+
+    def timed(self, name=None, rows=0):
+        '''
+        Decorator form of stage().
+
+        Parameters
+        ----------
+        name : str, optional
+            Stage name. The default is the function's name.
+        rows : int, 'out' or None, optional
+            Rows are len() of this positional argument, or of the result for
+            'out'. The default is 0 (the first argument); use 1 for methods.
+
+        '''
+        def decorate(func):
+            label = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(label) as rec:
+                    if isinstance(rows, int) and len(args) > rows:
+                        rec['rows'] = _length(args[rows])
+                    result = func(*args, **kwargs)
+                    if rows == 'out':
+                        rec['rows'] = _length(result)
+                return result
+            return wrapper
+        return decorate
+
+    def table(self):
+        '''The records as a DataFrame, in the order the stages finished.'''
+        import pandas as pd
+        return pd.DataFrame(self.records, columns=['stage', 'depth', 'rows', 'seconds',
+                                                   'cpu_seconds', 'maxrss_mb'])
+
+    def report(self, path):
+        '''
+        Write the records to a .json or .csv file, and every cProfile dump
+        to <stem>.<stage>.prof beside it.
+        '''
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == '.csv':
+            self.table().to_csv(path, index=False)
+        else:
+            with open(path, 'w') as f:
+                json.dump({'argv': sys.argv, 'stages': self.records}, f, indent=1)
+        for name, prof in self.profiles.items():
+            prof.dump_stats(path.with_name(f'{path.stem}.{name}.prof'))
+        return path
+
+
+def _length(obj):
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def _fromEnv():
+    stages = os.environ.get('PM25_CPROFILE', '')
+    profiler = Profiler([s for s in stages.split(',') if s])
+    if os.environ.get('PM25_PROFILE'):
+        atexit.register(lambda: profiler.report(os.environ['PM25_PROFILE']))
+    return profiler
+
+
+profiler = _fromEnv()
+stage = profiler.stage
+timed = profiler.timed
+
+
+if __name__ == "__main__":
+    import argparse
+    import runpy
+    # the analysis modules record into the imported module, not __main__
+    from profiling import profiler, stage
+
+    parser = argparse.ArgumentParser(description='Run an analysis script and report its stages.')
+    parser.add_argument('script', type=Path)
+    parser.add_argument('--out', type=Path, help='report (.json or .csv); default <script>.profile.json')
+    parser.add_argument('--cprofile', action='append', default=[], help='stage to cProfile (repeatable)')
+    args, rest = parser.parse_known_args()
+
+    profiler.cprofile.update(args.cprofile)
+    sys.argv = [str(args.script)] + rest
+    sys.path.insert(0, str(args.script.resolve().parent))
+    try:
+        with stage(args.script.stem):
+            runpy.run_path(str(args.script), run_name='__main__')
+    finally:
+        out = profiler.report(args.out or args.script.with_suffix('.profile.json'))
+        print(profiler.table().round(3).to_string(index=False))
+        print(f'report written to {out}')
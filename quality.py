@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Trip-quality metrics of every route from one pass over the traces, and a
+flag table the dose and summary analyses filter on instead of hand-picked
+route exclusions.
+Created on Sun Oct 18 08:11:53 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+from binning import DEG
+from loader import getColumn
+from profiling import timed
+
+FLAGS = ['short', 'long', 'gap', 'jumps_flag', 'speed_flag', 'terminal']
+# flags dropped by default; terminal visits depend on how the routes were cut,
+# so that flag is opt-in
+DROP = ['short', 'long', 'gap', 'jumps_flag', 'speed_flag']
+
+
+@timed()
+def tripQuality(df, minTime=18, maxTime=120, maxGap=300, jump=500, maxSpeed=60,
+                maxVisits=1, minAway=60, route='Route.Number', time='datetime_fixed'):
+    '''
+    Quality metrics and flags of every route.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Traces with route, time, Longitude and Latitude (columns or index
+        levels), and InTerminal if already computed.
+    minTime, maxTime : num, optional
+        Shortest and longest plausible circuit (min). The defaults are 18
+        and 120, the window used for the dose regression.
+    maxGap : num, optional
+        Longest tolerated gap between fixes (s). The default is 300.
+    jump : num, optional
+        A step between consecutive fixes longer than this (m) is a GPS
+        jump. The default is 500, over twice what a jeepney covers between
+        two 15 s fixes.
+    maxSpeed : num, optional
+        A step implying more than this speed (km/h) is a speed outlier. The
+        default is 60.
+    maxVisits : int, optional
+        Most terminal visits (runs of fixes inside the terminal) in a
+        circuit. A normal circuit has one, whether it is cut on leaving the
+        terminal (segmentRoutes: the visit is at its end) or on arriving
+        (the visit is at its start). Routes visiting more often, or never,
+        are flagged. The default is 1.
+    minAway : num, optional
+        Time outside the terminal (s) shorter than this does not end a
+        visit, so GPS flicker at the terminal edge is one visit. The
+        default is 60.
+
+    Returns
+    -------
+    DataFrame
+        Indexed by route: duration (min), fixes, max_gap (s), jumps,
+        speed_outliers, terminal_visits, one boolean column per flag
+        (short, long, gap, jumps_flag, speed_flag, terminal) and ok (none of
+        the DROP flags raised).
+
+    '''
+    r = getColumn(df, route)
+    t = getColumn(df, time).astype('datetime64[ns]').astype(np.int64)
+    lon, lat = getColumn(df, 'Longitude'), getColumn(df, 'Latitude')
+    if 'InTerminal' in df.columns:
+        inTerminal = df['InTerminal'].values.astype(bool)
+    else:
+        from geofence import terminal
+        inTerminal = terminal.contains(lon, lat)
+
+    order = np.lexsort((t, r))
+    r, t, lon, lat, inTerminal = r[order], t[order], lon[order], lat[order], inTerminal[order]
+
+    new = np.r_[True, r[1:] != r[:-1]]
+    starts = np.flatnonzero(new)
+    ends = np.r_[starts[1:], len(r)] - 1
+    group = np.cumsum(new) - 1
+    n = len(starts)
+
+    # steps between consecutive fixes of the same route
+    same = ~new[1:]
+    dt = np.diff(t)[same] / 1e9
+    dist = np.hypot(np.diff(lon)[same] * DEG * np.cos(np.radians(lat[1:][same])),
+                    np.diff(lat)[same] * DEG)
+    stepGroup = group[1:][same]
+
+    maxGapSec = np.zeros(n)
+    np.maximum.at(maxGapSec, stepGroup, dt)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # repeated timestamps have no speed
+        speed = np.where(dt > 0, dist / dt * 3.6, 0)
+
+    # a visit starts at a route's first fix inside the terminal, or at a fix
+    # inside after more than minAway outside
+    inside = np.flatnonzero(inTerminal)
+    firstInside = np.r_[True, group[inside][1:] != group[inside][:-1]]
+    away = np.r_[0, np.diff(t[inside])] > minAway * 1e9
+    visits = inside[firstInside | (away & ~inTerminal[np.maximum(inside - 1, 0)])]
+
+    out = pd.DataFrame({'duration': (t[ends] - t[starts]) / 60e9,
+                        'fixes': ends - starts + 1,
+                        'max_gap': maxGapSec,
+                        'jumps': np.bincount(stepGroup[dist > jump], minlength=n),
+                        'speed_outliers': np.bincount(stepGroup[speed > maxSpeed], minlength=n),
+                        'terminal_visits': np.bincount(group[visits], minlength=n)},
+                       index=pd.Index(r[starts], name=route))
+
+    out['short'] = out['duration'] < minTime
+    out['long'] = out['duration'] > maxTime
+    out['gap'] = out['max_gap'] > maxGap
+    out['jumps_flag'] = out['jumps'] > 0
+    out['speed_flag'] = out['speed_outliers'] > 0
+    out['terminal'] = (out['terminal_visits'] == 0) | (out['terminal_visits'] > maxVisits)
+    out['ok'] = ~out[DROP].any(axis=1)
+    return out
+
+
+def dropFlagged(df, quality, flags=DROP, route='Route.Number'):
+    '''
+    The traces without the routes raising any of `flags` in tripQuality().
+    The default leaves out the terminal flag; pass flags=FLAGS to drop on
+    every flag.
+    '''
+    bad = quality.index[quality[list(flags)].any(axis=1)]
+    return df[~np.isin(getColumn(df, route), bad)]
+
+
+if __name__ == "__main__":
+    # terminal visits with routes cut on leaving the terminal (segmentRoutes)
+    # and on arriving, from waits in the terminal around a normal circuit,
+    # one back in the terminal within the 10 min rule (so the second
+    # departure does not start a route), one arriving with GPS flicker at
+    # the terminal edge and one that never comes back
+    from segment import segmentRoutes
+
+    wait = [True] * 4
+    circuit = [False] * 120
+    back = [False] * 20 + wait + [False] * 100
+    flicker = [True, True, False] + wait
+
+    def day(blocks):
+        inTerminal = np.concatenate(blocks).astype(bool)
+        times = pd.date_range('2018-11-12 05:00', periods=len(inTerminal), freq='15s').values
+        # about 65 m between the terminal and the road, under maxSpeed
+        lon = np.where(inTerminal, 121.0741, 121.0735)
+        return pd.DataFrame({'datetime_fixed': times, 'Longitude': lon, 'Latitude': 14.632,
+                             'InTerminal': inTerminal})
+
+    df = day([wait, circuit, wait, back, wait, circuit])
+    # a repeated timestamp 100 m off is not a speed outlier
+    df = pd.concat([df, df.iloc[[50]].assign(Longitude=121.0745)]).sort_index(kind='stable')
+    df['Route.Number'] = segmentRoutes(df['datetime_fixed'].values, df['InTerminal'].values)
+    quality = tripQuality(df, minTime=0)
+    print(quality[['duration', 'speed_outliers', 'terminal_visits', 'terminal', 'ok']])
+    # route 0 is the wait before the first departure
+    assert quality['terminal_visits'].tolist() == [1, 1, 2, 0]
+    assert quality['terminal'].tolist() == [False, False, True, True]
+    assert (quality['speed_outliers'] == 0).all()
+    # the terminal flag is opt-in
+    assert quality['ok'].all()
+    assert len(dropFlagged(df, quality)) == len(df)
+    assert len(dropFlagged(df, quality, flags=FLAGS)) < len(df)
+
+    # cut on arriving, each route starts with its wait
+    routes = [wait + circuit, flicker + circuit, wait + back, wait + circuit]
+    df = day(routes)
+    df['Route.Number'] = np.repeat(np.arange(len(routes)), [len(r) for r in routes])
+    assert tripQuality(df, minTime=0)['terminal_visits'].tolist() == [1, 1, 2, 1]
@@ -7,22 +7,12 @@ Created on Tue Jun 28 14:09:35 2022
 @author: jarl
 """
 
-import pandas as pd
-from pathlib import Path
-import datetime as dt
-import matplotlib.pyplot as plt
-import numpy as np
-import statsmodels.api as sm
-from sklearn.linear_model import LinearRegression
+from calibration import calibrate
+from colocation import loadColocation
+# from sklearn.linear_model import LinearRegression  # for stats2()
 
-file = Path('/Users/jarl/Documents/Observatory/ccarph/Jeepney Data/Hourly Averages_new.xlsx')
-
-# df = pd.read_excel(file, sheet_name='Time Series')\
-#     .drop(columns=['Date', 'Time', 'Seconds']).dropna()
-
-df = pd.read_excel(file, sheet_name='Time Series', usecols=['Sensor 1','Sensor 2', 'Sensor 3',
-                                                            'Sensor 4', 'Sensor 5', 'Sensor 6',
-                                                            'Sensor 7', 'BAM']).dropna()
+# hourly sensor means from the raw co-location data, aligned with the BAM
+df = loadColocation(freq='1h').dropna()
 
 # def stats2(sensor_col):
 #     '''
@@ -53,39 +43,11 @@ df = pd.read_excel(file, sheet_name='Time Series', usecols=['Sensor 1','Sensor 2
 #     return reg
 
 
-def statsmodels(sensor_col):
-    '''
-    Get regression using statsmodels
-
-    Parameters
-    ----------
-    sensor_col : str
-        DataFrame column label.
-
-    Returns
-    -------
-    reg : regression object
-        reg.summary() shows the scores.
-
-    '''
-    
-    Y = df[sensor_col].values
-    X = df['BAM'].values
-    X = sm.add_constant(X)
-    
-    res = sm.OLS(Y, X).fit()
-
-    print(f'\n*** {sensor_col} ***')
-    print(f"r2: {round(res.rsquared, 2)}")
-    print(f'm, b: {round(res.params[1], 2)}, {round(res.params[0], 2)}')
-    print(f"dm, db: {round(res.bse[1], 2)}, {round(res.bse[0], 2)}")
-    
-    return res
-    
-
-sensors = list(df.columns[:-1])
+# slope, intercept, standard errors and r2 of every sensor in one solve
+fits = calibrate(df, reference='BAM')
 
-for sensor in sensors:
-    # df[sensor] = df[sensor].apply(recalib)
-    reg = statsmodels(sensor)
-    
\ No newline at end of file
+for sensor, res in fits.iterrows():
+    print(f'\n*** {sensor} ***')
+    print(f"r2: {round(res['r2'], 2)}")
+    print(f"m, b: {round(res['slope'], 2)}, {round(res['intercept'], 2)}")
+    print(f"dm, db: {round(res['slope_se'], 2)}, {round(res['intercept_se'], 2)}")
@@ -7,19 +7,14 @@ Created on Tue Jun 28 14:09:35 2022
 @author: jarl
 """
 
-import pandas as pd
-from pathlib import Path
-import datetime as dt
 import matplotlib.pyplot as plt
 import numpy as np
-import statsmodels.api as sm
-from sklearn.linear_model import LinearRegression
+from calibration import calibrate
+from colocation import loadColocation
+# from sklearn.linear_model import LinearRegression  # for stats2()
 
-file = Path('/Users/jarl/Documents/Observatory/ccarph/Jeepney Data/Hourly Averages_new.xlsx')
-
-df = pd.read_excel(file, sheet_name='Time Series', usecols=['Sensor 1','Sensor 2', 'Sensor 3',
-                                                            'Sensor 4', 'Sensor 5', 'Sensor 6',
-                                                            'Sensor 7', 'BAM']).dropna()
+# hourly sensor means from the raw co-location data, aligned with the BAM
+df = loadColocation(freq='1h').dropna()
 df = df.dropna()
 
 # df['datetime']= pd.to_datetime(df['Seconds'], unit='s')
@@ -32,17 +27,11 @@ def recalib(pm25, m=1.169, b=0):
 
 def stats(df, ax):
     
-    Y = df['Sensor 1'].values
-    X = df['BAM'].values
-    X = sm.add_constant(X)
-    
-    res = sm.OLS(Y, X).fit()
-    
-    pred_ols = res.get_prediction()
+    res = calibrate(df, reference='BAM', sensors=['Sensor 1']).loc['Sensor 1']
     
-    m = round(res.params[1], 2)
-    b = round(res.params[0], 2)
-    r2 = round(res.rsquared, 2)
+    m = round(res['slope'], 2)
+    b = round(res['intercept'], 2)
+    r2 = round(res['r2'], 2)
     
     x = np.linspace(0, 50, 100)
     y = m*x + b
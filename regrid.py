@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Every sensor's trace on one common regular time grid, as a sensor x time
+array, filled one vectorized sensor row at a time. Grid points are
+interpolated from the fixes either side unless the fixes are more than
+maxGap apart, in which case they are NaN and marked in an explicit gap mask.
+Created on Sun Oct 18 08:12:59 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+from loader import getColumn
+from profiling import timed
+
+
+@timed()
+def sensorGrid(df, freq='15s', maxGap=60, how='linear', start=None, end=None,
+               sensor='sensor', time='datetime_fixed', value='calib_pm25', dtype=np.float32):
+    '''
+    Resample all sensors onto a shared grid.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Traces with sensor, time and value as columns or index levels, in
+        any order. Fixes with NaN values are ignored.
+    freq : str, optional
+        Grid spacing. The default is '15s', the nominal cadence.
+    maxGap : num, optional
+        Longest gap between fixes (s) that is bridged. Grid points inside a
+        longer gap, or before a sensor's first / after its last fix, are
+        gaps. The default is 60.
+    how : 'linear' or 'nearest', optional
+        Interpolation between the fixes either side. The default is
+        'linear'.
+    start, end : date-like, optional
+        Grid span. The default covers every fix, aligned to `freq`.
+    dtype : optional
+        dtype of the grid. The default is float32.
+
+    Returns
+    -------
+    sensors : array
+        Sensor of every row.
+    times : array of datetime64
+        Grid times, the columns.
+    grid : array (sensors, times)
+        Resampled values, NaN in gaps.
+    gap : array of bool (sensors, times)
+        True where there is no value.
+
+    '''
+    s = getColumn(df, sensor)
+    t = getColumn(df, time).astype('datetime64[ns]').astype(np.int64)
+    c = getColumn(df, value).astype(float)
+    keep = ~np.isnan(c)
+    s, t, c = s[keep], t[keep], c[keep]
+
+    sensors, si = np.unique(s, return_inverse=True)
+    step = pd.Timedelta(freq).value
+    t0 = pd.Timestamp(start).value if start is not None else t.min() // step * step
+    t1 = pd.Timestamp(end).value if end is not None else -(-t.max() // step) * step
+    times = np.arange(t0, t1 + 1, step)
+
+    order = np.lexsort((t, si))
+    t, c = t[order], c[order]
+    bounds = np.searchsorted(si[order], np.arange(len(sensors) + 1))
+
+    if how not in ('linear', 'nearest'):
+        raise ValueError(f'unknown interpolation {how!r}')
+
+    # one sensor row at a time, so the temporaries are the length of a row
+    # rather than of the whole grid
+    grid = np.full((len(sensors), len(times)), np.nan, dtype=dtype)
+    gap = np.ones(grid.shape, dtype=bool)
+    for row, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        ts, cs = t[lo:hi], c[lo:hi]
+        # grid points outside the sensor's first and last fix are gaps
+        a, b = np.searchsorted(times, [ts[0], ts[-1]], side='left')
+        b += times[min(b, len(times) - 1)] == ts[-1]
+        gt = times[a:b]
+
+        nxt = np.searchsorted(ts, gt, side='left')
+        prev = np.searchsorted(ts, gt, side='right') - 1
+        exact = ts[nxt] == gt
+        ok = exact | (ts[nxt] - ts[prev] <= maxGap * 1e9)
+
+        if how == 'linear':
+            width = np.where(ts[nxt] > ts[prev], ts[nxt] - ts[prev], 1)
+            values = cs[prev] + (cs[nxt] - cs[prev]) * ((gt - ts[prev]) / width)
+        else:
+            values = np.where(gt - ts[prev] <= ts[nxt] - gt, cs[prev], cs[nxt])
+        values[exact] = cs[nxt][exact]
+
+        grid[row, a:b] = np.where(ok, values, np.nan)
+        gap[row, a:b] = ~ok
+
+    return sensors, times.astype('datetime64[ns]'), grid, gap
+
+
+def gridFrame(sensors, times, grid):
+    '''sensorGrid() output as a DataFrame indexed by time, one column per sensor.'''
+    return pd.DataFrame(grid.T, index=pd.DatetimeIndex(times, name='datetime'),
+                        columns=pd.Index(sensors, name='sensor'))
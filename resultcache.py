@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of per-route results. Each analysis, version of its
+code and set of parameters has its own file, in which every route is keyed by
+a hash of its input rows, so a rerun only recomputes new or changed routes.
+Results of routes not seen for a while, and files of old code or parameters,
+are evicted by age.
+Created on Sun Oct 18 08:05:39 2026
+"""
+
+import hashlib
+import inspect
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from loader import getColumn
+from profiling import timed
+
+CACHE_DIR = Path.home()/'.cache'/'pm25-paper'/'results'
+MAX_AGE = 30 * 86400  # s
+
+
+def routeHashes(df, route='Route.Number'):
+    '''
+    Hash of every route's rows (values and index).
+
+    Returns
+    -------
+    Series
+        Route -> 16-digit hex digest.
+
+    '''
+    r = getColumn(df, route)
+    rows = pd.util.hash_pandas_object(df, index=True).values
+    order = np.argsort(r, kind='stable')
+    r, rows = r[order], rows[order]
+
+    starts = np.flatnonzero(np.r_[True, r[1:] != r[:-1]])
+    # position-dependent mix so reordered rows give a different hash
+    pos = np.arange(len(r)) - np.repeat(starts, np.diff(np.r_[starts, len(r)]))
+    with np.errstate(over='ignore'):
+        mixed = rows * np.uint64(0x9E3779B97F4A7C15) + pos.astype(np.uint64)
+        total = np.add.reduceat(mixed, starts)
+    counts = np.diff(np.r_[starts, len(r)])
+    return pd.Series([f'{h:016x}{n:x}' for h, n in zip(total, counts)], index=r[starts])
+
+
+def codeVersion(func):
+    '''
+    Token of func's code: its qualified name and a hash of its source (or
+    bytecode when there is no source). Changes in the helpers func calls are
+    not seen; pass version= to cachedByRoute() for those.
+    '''
+    func = inspect.unwrap(func)
+    try:
+        code = inspect.getsource(func)
+    except (OSError, TypeError):
+        code = getattr(getattr(func, '__code__', None), 'co_code', b'').hex()
+    digest = hashlib.sha1(code.encode()).hexdigest()[:12]
+    return f'{getattr(func, "__module__", "")}.{getattr(func, "__qualname__", repr(func))}:{digest}'
+
+
+@timed(rows=1)
+def cachedByRoute(name, df, func, params=None, route='Route.Number', key='RouteNumber',
+                  version=None, maxAge=MAX_AGE, cachedir=CACHE_DIR):
+    '''
+    Run a per-route analysis through the cache.
+
+    Parameters
+    ----------
+    name : str
+        Name of the analysis; one cache file per name, version and set of
+        params.
+    df : DataFrame
+        Input traces, all routes or a subset of them.
+    func : callable
+        func(df, **params) -> DataFrame with one or more rows per route,
+        e.g. routeDose or dwellMatrix.
+    params : dict, optional
+        Parameters of func; part of the cache file name.
+    route : str, optional
+        Route column or index level of df. The default is 'Route.Number'.
+    key : str, optional
+        Column or index of the result holding the route. The default is
+        'RouteNumber' (routeDose); use 'Route.Number' for dwellMatrix.
+    version : str, optional
+        Extra version token, to bump when code that func calls changes.
+        func's own code is always part of the key (codeVersion()).
+    maxAge : num, optional
+        Results of routes not in any run for this long (s), and cache files
+        of the same name not written for this long, are evicted. The
+        default is 30 days.
+    cachedir : Path, optional
+        The default is ~/.cache/pm25-paper/results.
+
+    Returns
+    -------
+    DataFrame
+        Results of the routes in df, with `key` as a column, sorted by
+        route. Only routes that are new or whose rows changed are
+        recomputed; the cached results of changed routes are evicted, and
+        those of routes not in df are kept until they are maxAge old.
+
+    '''
+    params = params or {}
+    salt = json.dumps(params, sort_keys=True, default=str)
+    token = f'{codeVersion(func)}|{version}|{salt}'
+    hashes = routeHashes(df, route)
+    now = time.time()
+
+    path = Path(cachedir)/f'{name}-{hashlib.sha1(token.encode()).hexdigest()[:16]}.feather'
+    cached = feather.read_table(path).to_pandas() if path.exists() else None
+    changed = False
+    if cached is not None:
+        # routes of df whose rows no longer hash the same, and routes not
+        # seen in any run for maxAge
+        current = hashes.reindex(cached[key].values).values
+        present = pd.notna(current)
+        stale = present & (current != cached['_hash'].values)
+        stale |= ~present & (cached['_seen'].values < now - maxAge)
+        changed = stale.any()
+        cached = cached[~stale].copy()
+        # mark the routes of this run as seen, at most once a day so that
+        # unchanged reruns do not rewrite the file
+        seen = present[~stale] & (cached['_seen'].values < now - 86400)
+        if seen.any():
+            cached.loc[seen, '_seen'] = now
+            changed = True
+        missing = hashes.index[~hashes.index.isin(cached[key])]
+    else:
+        missing = hashes.index
+
+    if len(missing):
+        fresh = func(df[np.isin(getColumn(df, route), missing)], **params)
+        if key not in fresh.columns:
+            fresh = fresh.reset_index()
+        fresh['_hash'] = hashes.reindex(fresh[key].values).values
+        fresh['_seen'] = now
+        cached = fresh if cached is None else pd.concat([cached, fresh], ignore_index=True)
+        changed = True
+
+    if changed:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        feather.write_feather(cached.reset_index(drop=True), path)
+
+    # files of older code or other params
+    for other in Path(cachedir).glob(f'{name}-*.feather'):
+        try:
+            if other != path and other.stat().st_mtime < now - maxAge:
+                other.unlink()
+        except FileNotFoundError:
+            pass
+
+    cached = cached[cached[key].isin(hashes.index)]
+    return cached.drop(columns=['_hash', '_seen']).sort_values(key, kind='stable', ignore_index=True)
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized route segmentation. Replaces the row-wise compare/departCheck in
+routecount.py and the delta thresholding in routecount_xent.py.
+Created on Sun Oct 18 07:53:30 2026
+"""
+
+import json
+
+import numpy as np
+
+from profiling import timed
+
+
+def _firstOfSensor(sensors, n):
+    first = np.zeros(n, dtype=bool)
+    first[0] = True
+    if sensors is not None:
+        first[1:] = sensors[1:] != sensors[:-1]
+    return first
+
+
+def departures(times, inTerminal, sensors=None, mins=10, prevInTerminal=False,
+               lastDeparture=None):
+    '''
+    Find valid terminal departures.
+
+    A departure is a fix outside the terminal right after a fix inside it.
+    It only counts if more than `mins` minutes passed since the previous
+    counted departure of the same sensor (the 10-minute rule in routecount.py).
+
+    Parameters
+    ----------
+    times : array of datetime64
+        Fix times, sorted by sensor then time.
+    inTerminal : array of bool
+        Whether each fix is inside the terminal.
+    sensors : array, optional
+        Sensor of each fix. The default treats everything as one sensor.
+    mins : num, optional
+        Minimum minutes between departures. The default is 10.
+    prevInTerminal : bool, optional
+        State of the fix before times[0]. Only used with a single sensor.
+    lastDeparture : datetime64, optional
+        Last counted departure before times[0]. Only used with a single sensor.
+
+    Returns
+    -------
+    array of int
+        Positions of the fixes that start a new route.
+
+    '''
+    inTerminal = np.asarray(inTerminal, dtype=bool)
+    n = len(inTerminal)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+
+    first = _firstOfSensor(sensors, n)
+    before = np.empty(n, dtype=bool)
+    before[1:] = inTerminal[:-1]
+    before[first] = False
+    before[0] = prevInTerminal
+
+    dep = np.flatnonzero(before & ~inTerminal)
+    if len(dep) == 0:
+        return dep
+
+    window = int(mins * 60 * 1e9)
+    t = np.asarray(times).astype('datetime64[ns]').astype(np.int64)[dep]
+    # departures of each sensor; the window search stays inside one sensor's
+    # block, so it never runs from one sensor into the next
+    if sensors is None:
+        bounds = [0, len(dep)]
+    else:
+        s = np.asarray(sensors)[dep]
+        bounds = np.flatnonzero(np.r_[True, s[1:] != s[:-1], True])
+
+    # greedy walk over the departures only: each counted departure blocks the
+    # ones in the following window, so jump straight past them
+    valid = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        block = t[lo:hi]
+        i = 0
+        if lastDeparture is not None and lo == 0:
+            last = np.datetime64(lastDeparture, 'ns').astype(np.int64)
+            i = np.searchsorted(block, last + window, side='right')
+        while i < len(block):
+            valid.append(lo + i)
+            i = np.searchsorted(block, block[i] + window, side='right')
+
+    return dep[valid]
+
+
+@timed()
+def segmentRoutes(times, inTerminal, sensors=None, mins=10, start=0):
+    '''
+    Number the routes (circuits) of one or many sensors in a single pass.
+
+    Replaces running compare() over every fix in routecount.py: the route
+    number goes up by one at each valid departure and at the first fix of
+    every sensor after the first, so no route spans two vehicles. Numbers
+    are unique across sensors. It deliberately differs from compare()/departCheck() where those
+    were wrong (checked against them in the __main__ block):
+
+    - compare() tested `before==True & current==False`, which Python chains
+      as `before == (True & current) == False`; that is true when the fix and
+      the one before are both outside the terminal, so it counted time spent
+      away from the terminal rather than departures. Departures here are
+      inside -> outside transitions.
+    - departCheck() combined both times with the current date, so the gap
+      across midnight came out negative and the departure was dropped.
+      Gaps here are between full timestamps.
+    - PreInTerminal was shifted over the whole frame and terminaltime was a
+      global, so the first fix of a sensor saw the previous sensor's state,
+      and routeno was global, so a sensor's fixes before its first departure
+      joined the previous sensor's last route. Each sensor starts here on a
+      new route, outside the terminal with no prior departure.
+
+    Parameters
+    ----------
+    times, inTerminal, sensors, mins :
+        See departures().
+    start : int, optional
+        Route number of the first sensor before its first departure. The
+        default is 0.
+
+    Returns
+    -------
+    array of int
+        Route number of every fix.
+
+    '''
+    flags = np.zeros(len(inTerminal), dtype=np.int64)
+    flags[departures(times, inTerminal, sensors, mins)] = 1
+    if sensors is not None and len(flags):
+        flags[1:] |= _firstOfSensor(np.asarray(sensors), len(flags))[1:]
+    return np.cumsum(flags) + start
+
+
+@timed()
+def segmentGaps(times, inTerminal, sensors=None, mins=15, start=1):
+    '''
+    Number routes the way routecount_xent.py does: a route ends at the last
+    terminal fix before the vehicle stays away from the terminal for more
+    than `mins` minutes.
+
+    It deliberately differs from routecount_xent.py (checked against it in
+    the __main__ block) in that:
+
+    - gaps are measured in total seconds; `.dt.seconds` dropped whole days,
+      so a gap of a day and 5 minutes counted as 5 minutes
+    - gaps are never measured from one sensor's terminal fixes to the
+      next's, and every sensor after the first starts on a new route
+    - the route end is flagged by position; `df.loc[timestamps]` also
+      flagged every other sensor's fix at the same time
+
+    Parameters
+    ----------
+    times : array of datetime64
+        Fix times, sorted by sensor then time.
+    inTerminal : array of bool
+        Whether each fix is inside the terminal.
+    sensors : array, optional
+        Sensor of each fix. Gaps are never measured across sensors.
+    mins : num, optional
+        Minimum time away from the terminal. The default is 15.
+    start : int, optional
+        Number of the first route. The default is 1.
+
+    Returns
+    -------
+    array of int
+        Route number of every fix.
+
+    '''
+    inTerminal = np.asarray(inTerminal, dtype=bool)
+    flags = np.zeros(len(inTerminal), dtype=np.int64)
+
+    term = np.flatnonzero(inTerminal)
+    if len(term) > 1:
+        t = np.asarray(times).astype('datetime64[ns]').astype(np.int64)[term]
+        gap = np.diff(t) > mins * 60 * 1e9
+        if sensors is not None:
+            s = np.asarray(sensors)[term]
+            gap &= s[1:] == s[:-1]
+        flags[term[:-1][gap]] = 1
+    if sensors is not None and len(flags):
+        flags[1:] |= _firstOfSensor(np.asarray(sensors), len(flags))[1:]
+
+    return np.cumsum(flags) + start
+
+
+class RouteSegmenter:
+    '''
+    Streaming version of segmentRoutes() for data that arrives in chunks.
+
+    The terminal state of the last fix, the last counted departure and the
+    current route of every sensor are carried from one chunk to the next, so
+    a new upload can be numbered without touching the history. The state can
+    be checkpointed to JSON with save() and restored with load().
+
+    Feeding a sensor's fixes in any split gives the same numbers as
+    segmentRoutes() on the whole trace. With several sensors, new routes are
+    numbered in the order they arrive, and every sensor after the first
+    starts on a new route.
+
+    Parameters
+    ----------
+    mins : num, optional
+        Minimum minutes between departures. The default is 10.
+    start : int, optional
+        Route number before the first departure. The default is 0.
+
+    '''
+
+    def __init__(self, mins=10, start=0):
+        self.mins = mins
+        self.routeno = start
+        self.sensors = {}
+
+    def update(self, times, inTerminal, sensors=None):
+        '''
+        Number the routes of a new chunk of fixes.
+
+        Parameters
+        ----------
+        times : array of datetime64
+            Fix times, sorted by sensor then time, all later than the fixes
+            already seen for that sensor.
+        inTerminal : array of bool
+            Whether each fix is inside the terminal.
+        sensors : array, optional
+            Sensor of each fix. The default treats the chunk as one sensor.
+
+        Returns
+        -------
+        array of int
+            Route number of every fix in the chunk.
+
+        '''
+        times = np.asarray(times).astype('datetime64[ns]')
+        inTerminal = np.asarray(inTerminal, dtype=bool)
+        if sensors is None:
+            sensors = np.zeros(len(times), dtype=np.int64)
+        sensors = np.asarray(sensors)
+
+        routes = np.empty(len(times), dtype=np.int64)
+        if len(times) == 0:
+            return routes
+
+        bounds = np.flatnonzero(np.r_[True, sensors[1:] != sensors[:-1], True])
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            key = str(sensors[lo])
+            if key not in self.sensors and self.sensors:
+                # a new sensor starts on a new route, as in segmentRoutes()
+                self.routeno += 1
+            state = self.sensors.get(key, {'inTerminal': False, 'lastDeparture': None,
+                                           'lastTime': None, 'route': self.routeno})
+            t = times[lo:hi]
+            if state['lastTime'] is not None and t[0].astype(np.int64) <= state['lastTime']:
+                raise ValueError(f'sensor {key}: chunk starts before the last fix already segmented')
+
+            last = state['lastDeparture']
+            dep = departures(t, inTerminal[lo:hi], mins=self.mins,
+                             prevInTerminal=state['inTerminal'],
+                             lastDeparture=None if last is None else np.datetime64(last, 'ns'))
+
+            flags = np.zeros(hi - lo, dtype=np.int64)
+            flags[dep] = 1
+            counted = np.cumsum(flags)
+            # new routes take the next free numbers; fixes before the first
+            # departure continue the sensor's current route
+            routes[lo:hi] = np.where(counted > 0, self.routeno + counted, state['route'])
+
+            if len(dep):
+                self.routeno += len(dep)
+                state['route'] = self.routeno
+                state['lastDeparture'] = int(t[dep[-1]].astype(np.int64))
+            state['inTerminal'] = bool(inTerminal[hi - 1])
+            state['lastTime'] = int(t[-1].astype(np.int64))
+            self.sensors[key] = state
+
+        return routes
+
+    def stream(self, chunks, time='datetime_fixed', sensor='sensor', flag='InTerminal'):
+        '''
+        Number the routes of an iterable of DataFrame chunks, e.g. from
+        pd.read_csv(..., chunksize=n).
+
+        Yields
+        ------
+        DataFrame
+            Each chunk with a RouteCount column added.
+
+        '''
+        for chunk in chunks:
+            sensors = chunk[sensor].values if sensor in chunk else None
+            chunk['RouteCount'] = self.update(chunk[time].values, chunk[flag].values, sensors)
+            yield chunk
+
+    def save(self, path):
+        '''Write the carried state to a JSON checkpoint.'''
+        with open(path, 'w') as f:
+            json.dump({'mins': self.mins, 'routeno': self.routeno,
+                       'sensors': self.sensors}, f)
+
+    @classmethod
+    def load(cls, path):
+        '''Restore a segmenter from a JSON checkpoint.'''
+        with open(path) as f:
+            state = json.load(f)
+        seg = cls(mins=state['mins'], start=state['routeno'])
+        seg.sensors = state['sensors']
+        return seg
+
+
+if __name__ == "__main__":
+    # check against the legacy routecount.py / routecount_xent.py on several
+    # sensors over midnight, with the documented differences undone one by
+    # one (the sensors fix includes starting each sensor on a new route)
+    import datetime as dt
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    n = 6000
+    # 3 sensors on the same 15 s clock from 20:00 to past 21:00 the next day,
+    # randomly in and out of the terminal with short trips for the 10 min rule
+    times = pd.date_range('2018-11-12 20:00', periods=n, freq='15s')
+    df = pd.DataFrame({'sensor': np.repeat([1, 2, 3], n),
+                       'datetime_fixed': np.tile(times, 3),
+                       'InTerminal': np.repeat(rng.random(3 * n // 20) < 0.3, 20)})
+    sensors, t, inTerminal = df['sensor'].values, df['datetime_fixed'].values, df['InTerminal'].values
+
+    # routecount.py at the baseline (the debug print in departCheck removed)
+    def compare(before, current, time, date):
+        global routeno, terminaltime
+        if before==True & current==False:
+            if departCheck(time, date)==False:
+                routeno += 1
+                terminaltime[0] = time
+                terminaldate[0] = date
+                return routeno
+            else:
+                routeno += 0
+                return routeno
+        elif before==False & current==True:
+            return routeno
+        else:
+            return routeno
+
+    def departCheck(current_time, date, mins=10):
+        global terminaltime
+        terminaltime[1] = current_time
+        terminaldate[1] = date
+        datetime1 = dt.datetime.combine(date, terminaltime[0])
+        datetime2 = dt.datetime.combine(date, terminaltime[1])
+        if datetime2 - datetime1 <= dt.timedelta(minutes=mins):
+            return True
+        else: return False
+
+    def legacyRoutes(df, fixed=()):
+        '''The routecount.py driver, with some of the differences undone.'''
+        global routeno, terminaltime, terminaldate, compare, departCheck
+        df = df.set_index(['sensor', 'datetime_fixed'])
+        if 'sensors' in fixed:
+            df['PreInTerminal'] = df.groupby(level='sensor')['InTerminal'].shift(1, fill_value=False)
+        else:
+            df['PreInTerminal'] = df['InTerminal'].shift(1, fill_value=False)
+        legacy = compare, departCheck
+        if 'chained' in fixed:
+            def compare(before, current, time, date):
+                global routeno
+                if before and not current and not departCheck(time, date):
+                    routeno += 1
+                    terminaltime[0], terminaldate[0] = time, date
+                return routeno
+        if 'midnight' in fixed:
+            def departCheck(current_time, date, mins=10):
+                last = dt.datetime.combine(terminaldate[0], terminaltime[0])
+                return dt.datetime.combine(date, current_time) - last <= dt.timedelta(minutes=mins)
+
+        routeno = 0
+        terminaltime = [dt.time(0, 0), dt.time(0, 0)]
+        terminaldate = [dt.date(1, 1, 1), dt.date(1, 1, 1)]
+        out = []
+        for sensor in df.index.unique('sensor'):
+            if 'sensors' in fixed:
+                terminaltime[0], terminaldate[0] = dt.time(0, 0), dt.date(1, 1, 1)
+                routeno += len(out) > 0
+            sensordf = df.loc[sensor]
+            out.append(sensordf.apply(lambda x: compare(x['PreInTerminal'], x['InTerminal'],
+                                                        x.name.time(), x.name.date()), axis=1))
+        compare, departCheck = legacy
+        return np.concatenate(out)
+
+    # each difference on its own: the chained comparison counts a fix outside
+    # after a fix outside, not a departure
+    routeno, terminaltime, terminaldate = 0, [dt.time(0, 0)] * 2, [dt.date(1, 1, 1)] * 2
+    assert compare(True, False, dt.time(9, 0), dt.date(2018, 11, 12)) == 0
+    assert compare(False, False, dt.time(9, 30), dt.date(2018, 11, 12)) == 1
+    # a departure 25 min after one at 23:55 is dropped by the time-of-day gap
+    routeno, terminaltime, terminaldate = 1, [dt.time(23, 55), dt.time(0, 0)], [dt.date(2018, 11, 12)] * 2
+    assert departCheck(dt.time(0, 20), dt.date(2018, 11, 13))
+    assert segmentRoutes(np.array(['2018-11-12T23:54:45', '2018-11-12T23:55', '2018-11-13T00:19:45',
+                                   '2018-11-13T00:20'], dtype='datetime64[ns]'),
+                         np.array([True, False, True, False]))[-1] == 2
+
+    # every sensor starts on a new route: sensor 2's fixes before its first
+    # departure do not join sensor 1's last trip, in one pass or streamed
+    two = np.repeat([1, 2], 40)
+    twoT = np.tile(pd.date_range('2018-11-12 05:00', periods=40, freq='15s').values, 2)
+    twoIn = np.tile(np.r_[[True] * 5, [False] * 30, [True] * 5], 2)
+    routes = segmentRoutes(twoT, twoIn, two)
+    assert routes.tolist() == [0] * 5 + [1] * 35 + [2] * 5 + [3] * 35
+    seg = RouteSegmenter()
+    assert (np.concatenate([seg.update(twoT[two == s], twoIn[two == s], two[two == s])
+                            for s in (1, 2)]) == routes).all()
+    assert not set(segmentGaps(twoT, twoIn, two)[two == 1]) & set(segmentGaps(twoT, twoIn, two)[two == 2])
+
+    vectorized = segmentRoutes(t, inTerminal, sensors)
+    seg = RouteSegmenter()
+    streamed = [seg.update(t[i:i+1000], inTerminal[i:i+1000], sensors[i:i+1000])
+                for i in range(0, len(t), 1000)]
+    assert (np.concatenate(streamed) == vectorized).all()
+    fixes = ['chained', 'midnight', 'sensors']
+    for k in range(len(fixes) + 1):
+        legacy = legacyRoutes(df, fixes[:k])
+        print(f'routecount.py {"with " + ", ".join(fixes[:k]) + " fixed" if k else "as was"}: '
+              f'{(legacy != vectorized).sum()} of {len(df)} fixes differ')
+    assert (legacy == vectorized).all()
+
+    # routecount_xent.py at the baseline on the same frame, deltas in
+    # .dt.seconds, across sensors, and flags assigned by timestamp
+    def xentRoutes(df, fixed=()):
+        df = df.copy()
+        df['Datetime'] = df.datetime_fixed
+        df.set_index('Datetime', inplace=True)
+        starts = df[df.InTerminal]
+        delta = (starts.datetime_fixed.values[1:] - starts.datetime_fixed.values[:-1])
+        starts['delta'] = starts.index - starts.index
+        starts.iloc[:-1, -1] = delta
+        if 'sensors' in fixed:
+            starts.loc[np.r_[starts.sensor.values[1:] != starts.sensor.values[:-1], True], 'delta'] = pd.NaT
+        if 'seconds' in fixed:
+            starts['delta'] = starts.delta.dt.total_seconds()
+        else:
+            starts['delta'] = starts.delta.dt.seconds
+        if 'timestamps' in fixed:
+            df['route'] = np.isin(np.arange(len(df)),
+                                  np.flatnonzero(df.InTerminal.values)[(starts.delta > 15*60).values]).astype(int)
+        else:
+            df['route'] = 0
+            df.loc[starts[starts.delta > 15*60].index, 'route'] = 1
+        if 'sensors' in fixed:
+            df.iloc[np.flatnonzero(df.sensor.values[1:] != df.sensor.values[:-1]) + 1,
+                    df.columns.get_loc('route')] = 1
+        return (df['route'].cumsum() + 1).values
+
+    # .dt.seconds drops the day of a gap of a day and 5 minutes
+    gap = pd.DataFrame({'sensor': 1, 'InTerminal': True,
+                        'datetime_fixed': pd.to_datetime(['2018-11-12 08:00', '2018-11-13 08:05'])})
+    assert (xentRoutes(gap) == [1, 1]).all()
+    assert (segmentGaps(gap.datetime_fixed.values, gap.InTerminal.values) == [2, 2]).all()
+
+    vectorized = segmentGaps(t, inTerminal, sensors)
+    fixes = ['seconds', 'sensors', 'timestamps']
+    for k in range(len(fixes) + 1):
+        legacy = xentRoutes(df, fixes[:k])
+        print(f'routecount_xent.py {"with " + ", ".join(fixes[:k]) + " fixed" if k else "as was"}: '
+              f'{(legacy != vectorized).sum()} of {len(df)} fixes differ')
+    assert (legacy == vectorized).all()
+
+    print('segmentRoutes and segmentGaps match the legacy scripts up to the documented fixes')
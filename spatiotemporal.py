@@ -6,36 +6,37 @@ Spatiotemporal plots of PM2.5 in the UP-Katipunan PUJ route
 
 
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gs
-import geopandas as gpd
-import cartopy.crs as ccrs
-from shapely.geometry import Point
-import contextily as ctx
-import pyproj
+import tiles
 import numpy as np
-import matplotlib.ticker as mticker
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import time
+from profiling import timed
+
+# matplotlib, geopandas and cartopy are imported where they are used, so that
+# rasterize() and the constants can be used without the plotting stack
+
+EXTENT = [121.05877, 121.07879, 14.62918, 14.66153]  # bounds of the plot (?)
+VMIN, VMAX = 0, 90  # limits of the colorbar/histogram
 
 def add_basemap(gdf, ax, zoom, url='http://tile.stamen.com/terrain/tileZ/tileX/tileY.png'):
     """Add basemap to an Axes.
 
     This function adds a basemap from Stamen tiles. I think I just used a WGS84 extent to force the bounds here. 
-    Different tile types are available on the website.
+    Different tile types are available on the website. Tiles go through the disk cache in tiles.py, and
+    the basemap covers the fixed EXTENT the maps are drawn at, so it is only stitched once per zoom and
+    run whatever the coverage of the layer. Set PM25_TILES to a local z/x/y.png directory to render offline.
 
     Args:
-        gdf (_type_): GeoDataFrame containing the points from which extents are computed
+        gdf (_type_): GeoDataFrame of the layer (unused; the basemap covers EXTENT)
         ax (_type_): Figure Axes where the basemap is to be added
         zoom (_type_): Zoom level
         url (str, optional): URL for the basemap style Defaults to 'http://tile.stamen.com/terrain/tileZ/tileX/tileY.png'
     """
-    # finding the extent of the input data so that the basemap covers the whole of the graph;
-    # we use geopandas to convert the input dataframe to EPSG:3857 which is what contextily uses
-    xmin, ymin, xmax, ymax = gdf.to_crs(epsg=3857).total_bounds 
-    
-    basemap, extent = ctx.bounds2img(xmin, ymin, xmax, ymax, zoom=zoom, url=url) 
-    # bounds2img is a contextily function that takes the given basemap from stamen design
+    # the basemap covers the extent the maps are drawn at, not the layer's own bounds, so
+    # strata with different coverage share one stitched basemap
+    basemap, extent = tiles.extent2img(EXTENT, zoom=zoom, url=url)
+    # bounds2img takes the given basemap from stamen design (same as the contextily function)
     
     #This is just a lambda function to reproject a given x & y coordinate from EPSG:3857 (which is the default contextily reference system) to EPSG:4326 
     #(which is WGS84, the usual default for QGIS; in case it doesn't work, you should try to see what EPSG file your input data is in).
@@ -58,6 +59,9 @@ def lat_lon_labels(ax, extent, nx = 2, ny = 3):
         nx (int, optional): Number of ticks along x. Defaults to 2.
         ny (int, optional): Number of ticks along y. Defaults to 3.
     """
+    import matplotlib.ticker as mticker
+    from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
+
     gl = ax.gridlines(draw_labels=True)
     gl.xlabels_top=False
     gl.ylabels_right=False
@@ -70,21 +74,75 @@ def lat_lon_labels(ax, extent, nx = 2, ny = 3):
     
 
 ### gdf plotting ###
-def spatiotemporal(gdf, axis):
+def rasterize(lon, lat, values, extent=EXTENT, pixels=300, how='mean'):
+    """Aggregate points into a fixed-resolution image over the map extent.
+
+    Args:
+        lon, lat (array): Point coordinates
+        values (array): Value of each point
+        extent (list, optional): Image bounds (lon0, lon1, lat0, lat1). Defaults to EXTENT.
+        pixels (int, optional): Pixels along the longer side of the extent. Defaults to 300.
+        how (str, optional): 'mean' or 'max' of the points in a pixel. Defaults to 'mean'.
+
+    Returns:
+        array: (rows, cols) image, first row at the south edge, NaN where there are no points
+    """
+    x0, x1, y0, y1 = extent
+    size = max(x1 - x0, y1 - y0) / pixels
+    nx, ny = int(np.ceil((x1 - x0) / size)), int(np.ceil((y1 - y0) / size))
+
+    lon, lat, values = np.asarray(lon), np.asarray(lat), np.asarray(values, dtype=float)
+    ix = np.floor((lon - x0) / size).astype(int)
+    iy = np.floor((lat - y0) / size).astype(int)
+    ok = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny) & ~np.isnan(values)
+    flat = iy[ok] * nx + ix[ok]
+    values = values[ok]
+
+    img = np.full(nx * ny, np.nan)
+    if how == 'mean':
+        count = np.bincount(flat, minlength=nx*ny)
+        total = np.bincount(flat, weights=values, minlength=nx*ny)
+        filled = count > 0
+        img[filled] = total[filled] / count[filled]
+    elif how == 'max':
+        order = np.argsort(flat, kind='stable')
+        flat, values = flat[order], values[order]
+        starts = np.flatnonzero(np.diff(flat, prepend=-1))
+        if len(starts):
+            img[flat[starts]] = np.maximum.reduceat(values, starts)
+    else:
+        raise ValueError(f"how must be 'mean' or 'max', not {how!r}")
+
+    return img.reshape(ny, nx)
+
+
+def spatiotemporal(gdf, axis, extent=EXTENT, vmin=VMIN, vmax=VMAX, hide_label=False,
+                   mode='points', pixels=300, how='mean'):
     """Create spatiotemporal plot.
 
     Circles are placed centered at a pair of coordinates, 
     and colored by the cmap corresponding the the mean PM2.5 value.
+    With mode='raster' the points are aggregated into a fixed-resolution image instead
+    (see rasterize()), which keeps render time and file size flat for dense data.
 
     Args:
         gdf (_type_): GeoDataFrame from which spatiotemporal plot is created
         axis (_type_): Axes where plot is to be added
+        extent (list, optional): Map bounds (lon0, lon1, lat0, lat1). Defaults to EXTENT.
+        vmin, vmax (float, optional): Colormap limits. Default to VMIN, VMAX.
+        hide_label (bool, optional): Skip the lat-lon labels. Defaults to False.
+        mode (str, optional): 'points' or 'raster'. Defaults to 'points'.
+        pixels, how (optional): Raster resolution and reduction, see rasterize().
     """
-    global extent, vmin, vmax, hide_label
-    
-    gdf.plot('calib_pm25', cmap='rainbow', ax=axis, vmin=vmin , vmax=vmax, 
-             legend = False,edgecolors='k',linewidth=0.2, markersize=9, 
-             legend_kwds={'label': 'PM Concentration ($\mu$g m$^{-3}$)', 'fraction':0.0785})
+    if mode == 'raster':
+        img = rasterize(gdf.geometry.x, gdf.geometry.y, gdf['calib_pm25'], extent, pixels, how)
+        # above the basemap, which is added afterwards
+        axis.imshow(img, extent=extent, origin='lower', cmap='rainbow', vmin=vmin, vmax=vmax,
+                    interpolation='nearest', zorder=2)
+    else:
+        gdf.plot('calib_pm25', cmap='rainbow', ax=axis, vmin=vmin , vmax=vmax, 
+                 legend = False,edgecolors='k',linewidth=0.2, markersize=9, 
+                 legend_kwds={'label': 'PM Concentration ($\mu$g m$^{-3}$)', 'fraction':0.0785})
 
     add_basemap(gdf, axis, 16, 'http://tile.stamen.com/terrain/{z}/{x}/{y}.png')
     axis.set_extent(extent)
@@ -93,7 +151,7 @@ def spatiotemporal(gdf, axis):
 
 
 ### histogram plotting ###
-def histplot(gdf, axis):
+def histplot(gdf, axis, hide_label=False):
     """Create companion histogram for the spatiotemporal plot.
 
     Histograms are expressed as density, normalized by bin width (10 ug/m3), 
@@ -102,14 +160,16 @@ def histplot(gdf, axis):
     Args:
         gdf (_type_): GeoDataFrame from which spatiotemporal plot is created
         axis (_type_): Axes where plot is to be added
+        hide_label (bool, optional): Hide the y tick labels. Defaults to False.
     """
-    global hide_label
+    from matplotlib.ticker import LinearLocator
+
     n,bins,patches = axis.hist(gdf['calib_pm25'], density=True, 
                                bins=np.linspace(0,90,10), color='gray', 
                                linewidth=1, edgecolor='w')
     axis.set_xlim(0,90)
     axis.set_ylim(0, 0.05)
-    axis.yaxis.set_major_locator(plt.LinearLocator(3))
+    axis.yaxis.set_major_locator(LinearLocator(3))
     if hide_label == True:
         axis.set_yticklabels([])
 
@@ -121,158 +181,111 @@ def histplot(gdf, axis):
     #     plt.setp(p, 'facecolor', cmhist(c))
 
 
-if __name__ == "__main__":
-    ### Point these to the geojson files created using geopandas ###
-    root = Path(input("Path to gdf data: "))
-    alldata = [root/'Alldata_SpatiallyGrouped.geojson']
-
-    rush = [root/'Filtered_AMPEAK_SpatiallyGrouped.geojson',
-            root/'Filtered_OFFPEAK_SpatiallyGrouped.geojson',
-            root/'Filtered_PMPEAK_SpatiallyGrouped.geojson'
-            ]
-
-    week = [root/'Filtered_Weekday_SpatiallyGrouped.geojson',
-            root/'Filtered_Weekend_SpatiallyGrouped.geojson'
-            ]
-
-    # read the gdfs
-    rush_gdf = []
-    week_gdf = []
+### batch rendering ###
+# Every figure of the paper as a declarative spec: panel titles and the geojson
+# (relative to the data root) drawn in each panel. Labels are only drawn on
+# the first panel to avoid redundancy. Add 'mode': 'raster' (and optionally
+# 'pixels'/'how') to a spec to draw its panels as aggregated images.
+FIGURES = [
+    {'name': 'rushhours', 'figsize': (7,5), 'dpi': 250,
+     'panels': [('AM rush hours', 'Filtered_AMPEAK_SpatiallyGrouped.geojson'),
+                ('Non-rush hours', 'Filtered_OFFPEAK_SpatiallyGrouped.geojson'),
+                ('PM rush hours', 'Filtered_PMPEAK_SpatiallyGrouped.geojson')]},
+    {'name': 'week', 'figsize': (5,5), 'dpi': 250,
+     'panels': [('Weekday', 'Filtered_Weekday_SpatiallyGrouped.geojson'),
+                ('Weekend', 'Filtered_Weekend_SpatiallyGrouped.geojson')]},
+    {'name': 'all_week', 'figsize': (7,5), 'dpi': 250,
+     'panels': [('All runs', 'Alldata_SpatiallyGrouped.geojson'),
+                ('Weekday', 'Filtered_Weekday_SpatiallyGrouped.geojson'),
+                ('Weekend', 'Filtered_Weekend_SpatiallyGrouped.geojson')]},
+    {'name': 'allruns', 'figsize': (4,5), 'dpi': 200,
+     'panels': [('All runs', 'Alldata_SpatiallyGrouped.geojson')]},
+]
+
+
+@timed(rows=None)
+def render_figure(spec, root, outdir, extent=EXTENT, vmin=VMIN, vmax=VMAX):
+    """Render one figure spec to outdir/<name>.png.
+
+    Each panel is a map with its histogram below, and the colorbar shared by all panels
+    sits on the right.
 
-    alldata_gdf = gpd.read_file(alldata[0])
+    Args:
+        spec (dict): One entry of FIGURES
+        root (Path): Directory holding the geojson files
+        outdir (Path): Where the png is written
+        extent, vmin, vmax: See spatiotemporal()
 
-    for file in rush:
-        gdf = gpd.read_file(file)
-        rush_gdf.append(gdf)
-        
-    for file in week:
-        gdf = gpd.read_file(file)
-        week_gdf.append(gdf)
+    Returns:
+        tuple: Figure name, output path and render time in seconds
+    """
+    import matplotlib.pyplot as plt
+    import geopandas as gpd
+    import cartopy.crs as ccrs
 
-    extent = [121.05877, 121.07879, 14.62918, 14.66153]  # bounds of the plot (?)
+    start = time.perf_counter()
+    n = len(spec['panels'])
     proj = ccrs.PlateCarree()  # set projection to be platecarree
-    vmin, vmax = 0, 90  # limits of the colorbar/histogram
-
-
-    ################ Rush hours ################
-    fig = plt.figure(figsize=(7,5), dpi=250)
-    gs = fig.add_gridspec(2,4, height_ratios=[4,1], width_ratios=[10,10,10,1])
-    gs.update(hspace=0.2, wspace=0.1)
-
-    # lists of subplots
-    st = []
-    hist = []
-
-    # create subplots
-    for i in range(3):
-        spatemp = fig.add_subplot(gs[0, i], projection=proj)
-        st.append(spatemp)
-        histogram = fig.add_subplot(gs[1, i])
-        hist.append(histogram)
-        
-    st[0].set_title('AM rush hours') 
-    st[1].set_title('Non-rush hours') 
-    st[2].set_title('PM rush hours') 
-        
-    # make spatiotemporal plots
-    for i in range(3):
-        hide_label = False  # hide labels to avoid redundancy
-        if i>0:
-            hide_label = True
-        spatiotemporal(rush_gdf[i], st[i])
-        histplot(rush_gdf[i], hist[i])
-        
-    # add colorbar shared by both plots
-    cax = fig.add_subplot(gs[:,-1])
+
+    fig = plt.figure(figsize=spec['figsize'], dpi=spec['dpi'])
+    grid = fig.add_gridspec(2, n+1, height_ratios=[4,1], width_ratios=[10]*n + [1])
+    grid.update(hspace=0.2, wspace=0.1)
+
+    for i, (title, file) in enumerate(spec['panels']):
+        gdf = gpd.read_file(Path(root)/file)
+        st = fig.add_subplot(grid[0, i], projection=proj)
+        hist = fig.add_subplot(grid[1, i])
+        st.set_title(title)
+        spatiotemporal(gdf, st, extent, vmin, vmax, hide_label=i>0,
+                       mode=spec.get('mode', 'points'), pixels=spec.get('pixels', 300),
+                       how=spec.get('how', 'mean'))
+        histplot(gdf, hist, hide_label=i>0)
+
+    # add colorbar shared by all plots
+    cax = fig.add_subplot(grid[:,-1])
     sm = plt.cm.ScalarMappable(cmap='rainbow', norm=plt.Normalize(vmin=vmin, vmax=vmax))
     fig.colorbar(sm, cax=cax, extend='max')
     cax.set_ylabel('PM$_{2.5}$ Concentration ($\mu$g m$^{-3}$)')
 
+    out = Path(outdir)/f"{spec['name']}.png"
+    fig.savefig(out, bbox_inches='tight', facecolor='w')
+    plt.close(fig)
 
-    ################ Weekday-weekend ################
-    fig2 = plt.figure(figsize=(5,5), dpi=250)
-    gs2 = fig.add_gridspec(2,3, height_ratios=[4,1], width_ratios=[10,10,1])
-    gs2.update(hspace=0.2, wspace=0.1)
-
-    st2 = []
-    hist2 = []
-
-    for i in range(2):
-        spatemp = fig2.add_subplot(gs2[0, i], projection=proj)
-        st2.append(spatemp)
-        histogram = fig2.add_subplot(gs2[1, i])
-        hist2.append(histogram)
-
-    st2[0].set_title('Weekday')
-    st2[1].set_title('Weekend')
-
-    for i in range(2):
-        hide_label = False
-        if i>0:
-            hide_label = True
-        spatiotemporal(week_gdf[i], st2[i])
-        histplot(week_gdf[i], hist2[i])
-        
-    cax2 = fig2.add_subplot(gs2[:,2])
-    fig.colorbar(sm, cax=cax2, extend='max')
-    cax2.set_ylabel('PM$_{2.5}$ Concentration ($\mu$g m$^{-3}$)')
-
-
-    ################ All runs/weekday/weekend ################
-    fig3 = plt.figure(figsize=(7,5), dpi=250)
-    gs3 = fig.add_gridspec(2,4, height_ratios=[4,1], width_ratios=[10,10,10,1])
-    gs3.update(hspace=0.2, wspace=0.1)
-
-    st3 = []
-    hist3 = []
-
-    for i in range(3):
-        spatemp = fig3.add_subplot(gs3[0, i], projection=proj)
-        st3.append(spatemp)
-        histogram = fig3.add_subplot(gs3[1, i])
-        hist3.append(histogram)
-
-    hide_label = False
-    spatiotemporal(alldata_gdf, st3[0])
-    histplot(alldata_gdf, hist3[0])
-        
-    st3[0].set_title('All runs')
-    st3[1].set_title('Weekday')
-    st3[2].set_title('Weekend')
-
-    for i in range(2):
-        hide_label = True
-        spatiotemporal(week_gdf[i], st3[i+1])
-        histplot(week_gdf[i], hist3[i+1])
-        
-    cax3 = fig3.add_subplot(gs3[:,-1])
-    fig3.colorbar(sm, cax=cax3, extend='max')
-    cax3.set_ylabel('PM$_{2.5}$ Concentration ($\mu$g m$^{-3}$)')
-
-
-    ################ Single plot for all data ################
-    singlefig = plt.figure(figsize=(4,5), dpi=200)
-    gs1 = gs.GridSpec(2, 2, height_ratios=[4,1], width_ratios=[10,1])
-
-    st1 = plt.subplot(gs1[0, 0], projection=proj)
-    st1.set_title('All runs')
-
-    hist1 = plt.subplot(gs1[1, 0])
-
-    hide_label = False
-
-    spatiotemporal(alldata_gdf, st1)
-    histplot(alldata_gdf, hist1)
-        
-    cax = plt.subplot(gs1[:,1])
-    sm = plt.cm.ScalarMappable(cmap='rainbow', norm=plt.Normalize(vmin=vmin, vmax=vmax))
-    singlefig.colorbar(sm, cax=cax, extend='max')
-    cax.set_ylabel('PM$_{2.5}$ Concentration ($\mu$g m$^{-3}$)')
-    singlefig.tight_layout()
+    return spec['name'], out, time.perf_counter() - start
+
+
+def _headless():
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+
+def render_batch(root, outdir, specs=FIGURES, processes=None):
+    """Render a list of figure specs in a process pool on the Agg backend.
+
+    Args:
+        root (Path): Directory holding the geojson files
+        outdir (Path): Where the pngs are written; created if needed
+        specs (list, optional): Figure specs. Defaults to FIGURES.
+        processes (int, optional): Worker count. Defaults to one per CPU.
+
+    Returns:
+        list: (name, path, seconds) for every figure, in spec order
+    """
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(processes, initializer=_headless) as pool:
+        jobs = [pool.submit(render_figure, spec, root, outdir) for spec in specs]
+        results = [job.result() for job in jobs]
+
+    for name, out, seconds in results:
+        print(f'{name}: {seconds:.1f} s -> {out}')
+    return results
 
 
-    ### EDIT TO SAVE ###
-    # fig.savefig(path + /rushhours.png, bbox_inches='tight', facecolor='w')
-    # fig2.savefig(path + /week.png, bbox_inches='tight', facecolor='w')
-    # fig3.savefig(path + /all_week.png, bbox_inches='tight', facecolor='w')
-    # singlefig.savefig(path+'/allruns.png', bbox_inches='tight', facecolor='w')
+if __name__ == "__main__":
+    import sys
+
+    ### Point these to the geojson files created using geopandas ###
+    root = Path(sys.argv[1] if len(sys.argv) > 1 else input("Path to gdf data: "))
+    outdir = Path(sys.argv[2]) if len(sys.argv) > 2 else root/'figures'
+
+    render_batch(root, outdir)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Summary statistics of PM2.5 for every stratification in one grouped pass:
+mean, % of fixes above the thresholds and number of circuits.
+Created on Sun Oct 18 08:03:12 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+from binning import rushPeriod
+from profiling import timed
+
+THRESHOLDS = [90]  # µg/m3
+
+# stratum name -> column or function of the traces, as in binning.STRATA
+STRATA = {'Day': 'Day',
+          'Rush': rushPeriod}
+
+
+def partials(df, strata=STRATA, thresholds=THRESHOLDS, value='calib_pm25',
+             route='Route.Number'):
+    '''
+    Reduce the traces to sums, counts and exceedance counts per route and
+    combination of stratum groups. Everything summaryTable() reports can be
+    rolled up from this table, and tables of different chunks can simply be
+    concatenated before rolling up.
+    '''
+    c = df[value].values.astype(float)
+    ok = ~np.isnan(c)
+
+    keys = {route: df[route].values[ok]}
+    for name, how in strata.items():
+        labels = df[how].values if isinstance(how, str) else how(df)
+        keys[name] = np.asarray(labels)[ok]
+
+    part = pd.DataFrame(keys)
+    part['sum'] = c[ok]
+    part['count'] = 1
+    for t in thresholds:
+        part[f'above_{t:g}'] = c[ok] > t
+    return part.groupby(list(keys), dropna=False, sort=False).sum().reset_index()
+
+
+def rollup(part, strata=STRATA, thresholds=THRESHOLDS, route='Route.Number'):
+    '''
+    Turn partials() into the tidy summary table.
+
+    Returns
+    -------
+    DataFrame
+        stratum, group, circuits, fixes, mean and pct_above_<t> for every
+        threshold, one row per stratum group plus an 'All' row.
+
+    '''
+    above = [f'above_{t:g}' for t in thresholds]
+    rows = []
+    for name in ['All'] + list(strata):
+        if name == 'All':
+            grouped = part.assign(All='All').groupby('All')
+        else:
+            grouped = part.dropna(subset=[name]).groupby(name, sort=False)
+        table = grouped[['sum', 'count'] + above].sum()
+        table['circuits'] = grouped[route].nunique()
+        table = table.rename_axis('group').reset_index()
+        table.insert(0, 'stratum', name)
+        rows.append(table)
+
+    out = pd.concat(rows, ignore_index=True)
+    out['mean'] = out.pop('sum') / out['count']
+    for t, col in zip(thresholds, above):
+        out[f'pct_above_{t:g}'] = out.pop(col) / out['count'] * 100
+    out = out.rename(columns={'count': 'fixes'})
+    return out[['stratum', 'group', 'circuits', 'fixes', 'mean']
+               + [f'pct_above_{t:g}' for t in thresholds]]
+
+
+@timed()
+def summaryTable(df, strata=STRATA, thresholds=THRESHOLDS, value='calib_pm25',
+                 route='Route.Number'):
+    '''
+    Every configured statistic for every configured stratification.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Traces with the value, route and stratum columns.
+    strata : dict, optional
+        Stratum name -> column name or function(df). The default is
+        day type and rush period.
+    thresholds : list, optional
+        Exceedance thresholds (µg/m3). The default is [90].
+
+    Returns
+    -------
+    DataFrame
+        See rollup().
+
+    '''
+    return rollup(partials(df, strata, thresholds, value, route), strata, thresholds, route)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic jeepney traces in the layout of Alldata_tagged.csv, for tests and
+benchmarks without real data. Jeepneys loop between the terminal and the
+TMEs, dwell at each stop, and carry a PM2.5 signal with morning and evening
+peaks. A matching hourly BAM series is generated from the same signal.
+Created on Sun Oct 18 08:01:05 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+# stops along the UP-Katipunan loop, (name, lon, lat); the loop starts and
+# ends at the terminal
+STOPS = [('Terminal', 121.07418, 14.63172),
+         ('UPTC', 121.07020, 14.63560),
+         ('UP', 121.06520, 14.64780),
+         ('Miriam', 121.07390, 14.65210),
+         ('Ateneo', 121.07660, 14.64120),
+         ('Mcdo', 121.07540, 14.63720),
+         ('Balara', 121.07690, 14.65780)]
+LOOP = ['Terminal', 'UPTC', 'UP', 'Balara', 'Miriam', 'Ateneo', 'Mcdo', 'Terminal']
+
+DEG = 111320.0  # metres per degree of latitude
+FIX = 15  # seconds between fixes
+HOURS = (5, 21)  # operating hours
+
+
+def diurnal(hours):
+    '''Mean PM2.5 (µg/m3) by hour of day, with AM and PM rush peaks.'''
+    return (25 + 35 * np.exp(-((hours - 8) / 1.5)**2)
+            + 30 * np.exp(-((hours - 18) / 1.7)**2))
+
+
+def _knots(rng, day):
+    '''
+    Timeline of one jeepney-day as piecewise-linear knots: times (s from
+    midnight), lon, lat, and the departure times of each circuit.
+    '''
+    stops = {name: (lon, lat) for name, lon, lat in STOPS}
+    t = HOURS[0] * 3600 + rng.uniform(0, 1800)
+    times, lons, lats, departs = [], [], [], []
+
+    while t < HOURS[1] * 3600:
+        for i, name in enumerate(LOOP):
+            lon, lat = stops[name]
+            # dwell: long wait at the terminal before a circuit, short at TMEs
+            wait = rng.uniform(300, 1200) if i == 0 else rng.exponential(90)
+            times += [t, t + wait]
+            lons += [lon, lon]
+            lats += [lat, lat]
+            t += wait
+            if i == 0:
+                departs.append(t)
+            if i + 1 < len(LOOP):
+                nlon, nlat = stops[LOOP[i + 1]]
+                dist = np.hypot((nlon - lon) * DEG * np.cos(np.radians(lat)), (nlat - lat) * DEG)
+                t += dist / rng.uniform(3, 7)  # 11-25 km/h
+        t += 1  # keep knots strictly increasing between circuits
+
+    return np.array(times), np.array(lons), np.array(lats), np.array(departs)
+
+
+def sensorDay(rng, sensor, day, route0=0, drop=0.02, noise=5):
+    '''
+    Fixes of one sensor over one day.
+
+    Parameters
+    ----------
+    rng : Generator
+        numpy random generator.
+    sensor : int
+        Sensor number.
+    day : Timestamp
+        Date of the run.
+    route0 : int, optional
+        Last route number already used; circuits are numbered from route0+1.
+    drop : float, optional
+        Fraction of fixes lost. The default is 0.02.
+    noise : float, optional
+        GPS noise in metres. The default is 5.
+
+    Returns
+    -------
+    DataFrame
+        Same columns as Alldata_tagged.csv.
+
+    '''
+    ktimes, klon, klat, departs = _knots(rng, day)
+    secs = np.arange(ktimes[0], ktimes[-1], FIX)
+    secs = secs[rng.random(len(secs)) >= drop]
+
+    lon = np.interp(secs, ktimes, klon) + rng.normal(0, noise / DEG, len(secs))
+    lat = np.interp(secs, ktimes, klat) + rng.normal(0, noise / DEG, len(secs))
+    route = route0 + np.maximum(np.searchsorted(departs, secs, side='right'), 1)
+
+    # TME tag: within ~80 m of a stop
+    names = np.array([s[0] for s in STOPS], dtype=object)
+    d2 = ((lon[:, None] - np.array([s[1] for s in STOPS]))**2
+          + (lat[:, None] - np.array([s[2] for s in STOPS]))**2)
+    near = d2.min(axis=1) < (80 / DEG)**2
+    tme = np.where(near, names[d2.argmin(axis=1)], None)
+
+    hours = secs / 3600
+    # lognormal noise with some persistence, plus extra near busy stops
+    ar = np.convolve(rng.normal(0, 0.35, len(secs)), np.ones(8) / np.sqrt(8), mode='same')
+    pm = diurnal(hours) * np.exp(ar - 0.06) * np.where(near, 1.15, 1.0)
+
+    datetime = pd.Timestamp(day) + pd.to_timedelta(secs.round(), unit='s')
+    hour = datetime.hour
+    return pd.DataFrame({'datetime_fixed': datetime,
+                         'datetime': datetime,
+                         'sensor': sensor,
+                         'Latitude': lat,
+                         'Longitude': lon,
+                         'calib_pm25': pm.round(2),
+                         'Route.Number': route,
+                         'TME': tme,
+                         'Day': 'Weekday' if pd.Timestamp(day).dayofweek < 5 else 'Weekend',
+                         'Timegroup': np.where(((hour >= 6) & (hour < 9)) | ((hour >= 16) & (hour < 19)),
+                                               'peak', 'offpeak'),
+                         'Hour': hour})
+
+
+def generateTraces(sensors=7, days=30, start='2018-11-12', seed=0):
+    '''
+    Yield the synthetic data one (day, sensor) chunk at a time, so datasets
+    larger than memory can be written out.
+
+    Yields
+    ------
+    DataFrame
+        Fixes of one sensor-day, sorted by time.
+
+    '''
+    rng = np.random.default_rng(seed)
+    route0 = 0
+    for sensor in range(1, sensors + 1):
+        for day in pd.date_range(start, periods=days):
+            chunk = sensorDay(rng, sensor, day, route0)
+            route0 = chunk['Route.Number'].max()
+            yield chunk
+
+
+def daysFor(fixes, sensors=7):
+    '''Number of days needed for roughly `fixes` fixes.'''
+    perDay = (HOURS[1] - HOURS[0]) * 3600 / FIX
+    return max(1, int(np.ceil(fixes / (sensors * perDay))))
+
+
+def syntheticTraces(sensors=7, days=30, start='2018-11-12', seed=0):
+    '''All of generateTraces() in one DataFrame.'''
+    return pd.concat(generateTraces(sensors, days, start, seed), ignore_index=True)
+
+
+def writeTraces(path, sensors=7, days=30, start='2018-11-12', seed=0):
+    '''
+    Write synthetic traces to a CSV in the layout of Alldata_tagged.csv,
+    one sensor-day at a time.
+    '''
+    for i, chunk in enumerate(generateTraces(sensors, days, start, seed)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    return path
+
+
+def syntheticBAM(days=30, start='2018-11-12', seed=0):
+    '''
+    Hourly BAM reference following the same diurnal signal as the traces.
+
+    Returns
+    -------
+    DataFrame
+        Indexed by hour, with a BAM column (µg/m3).
+
+    '''
+    rng = np.random.default_rng(seed + 1)
+    index = pd.date_range(start, periods=days * 24, freq='h', name='datetime')
+    bam = diurnal(index.hour.values + 0.5) * np.exp(rng.normal(0, 0.15, len(index)))
+    return pd.DataFrame({'BAM': bam.round(1)}, index=index)
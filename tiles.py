@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Basemap tiles for the spatiotemporal figures, with a disk cache (LRU by size),
+in-process memoization of stitched basemaps and an offline mode.
+Created on Sun Oct 18 07:56:01 2026
+"""
+
+import hashlib
+import io
+import math
+import os
+import urllib.request
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from profiling import timed
+
+STAMEN = 'http://tile.stamen.com/terrain/{z}/{x}/{y}.png'
+TILE_SIZE = 256
+EARTH_RADIUS = 6378137.0  # EPSG:3857 sphere
+
+
+def _template(url):
+    '''Accept contextily's old tileX/tileY/tileZ placeholders as well.'''
+    return url.replace('tileZ', '{z}').replace('tileX', '{x}').replace('tileY', '{y}')
+
+
+def _toLonLat(x, y):
+    lon = math.degrees(x / EARTH_RADIUS)
+    lat = math.degrees(2 * math.atan(math.exp(y / EARTH_RADIUS)) - math.pi / 2)
+    return lon, lat
+
+
+def _fromLonLat(lon, lat):
+    x = math.radians(lon) * EARTH_RADIUS
+    y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) * EARTH_RADIUS
+    return x, y
+
+
+def _tileXY(lon, lat, zoom):
+    n = 2 ** zoom
+    lat = math.radians(lat)
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _tileOrigin(x, y, zoom):
+    '''Upper-left corner of a tile in EPSG:3857.'''
+    size = 2 * math.pi * EARTH_RADIUS / 2 ** zoom
+    half = math.pi * EARTH_RADIUS
+    return x * size - half, half - y * size
+
+
+def _decode(data):
+    import matplotlib.image as mpimg
+
+    img = mpimg.imread(io.BytesIO(data), format='png')
+    if img.dtype != np.uint8:
+        img = (img * 255).round().astype(np.uint8)
+    if img.ndim == 2:
+        img = np.dstack([img] * 3)
+    if img.shape[2] == 3:
+        img = np.dstack([img, np.full(img.shape[:2], 255, np.uint8)])
+    return img
+
+
+class TileCache:
+    '''
+    Fetch, cache and stitch XYZ tiles.
+
+    Tiles are stored under `directory`/<style hash>/z/x/y.png. A hit refreshes
+    the file's mtime, and the least recently used tiles are removed once the
+    cache grows past `maxBytes`. Stitched basemaps are also kept in memory per
+    (bounds, zoom, url), so panels sharing an extent only stitch once.
+
+    Parameters
+    ----------
+    directory : Path, optional
+        Disk cache. The default is ~/.cache/pm25-paper/tiles.
+    maxBytes : int, optional
+        Size limit of the disk cache. The default is 200 MB.
+    offline : Path, optional
+        Directory laid out as z/x/y.png to serve tiles from instead of the
+        network. Missing tiles are left blank rather than fetched. Setting
+        the PM25_TILES environment variable does the same.
+
+    '''
+
+    def __init__(self, directory=None, maxBytes=200 * 2**20, offline=None):
+        self.directory = Path(directory or Path.home()/'.cache'/'pm25-paper'/'tiles')
+        self.maxBytes = maxBytes
+        offline = offline or os.environ.get('PM25_TILES')
+        self.offline = Path(offline) if offline else None
+        self._memo = {}
+
+    def _path(self, url, x, y, zoom):
+        style = hashlib.md5(url.encode()).hexdigest()[:12]
+        return self.directory/style/str(zoom)/str(x)/f'{y}.png'
+
+    def tile(self, x, y, zoom, url=STAMEN):
+        '''
+        Raw PNG bytes of one tile, or None if it cannot be had.
+        '''
+        url = _template(url)
+        if self.offline is not None:
+            local = self.offline/str(zoom)/str(x)/f'{y}.png'
+            return local.read_bytes() if local.exists() else None
+
+        path = self._path(url, x, y, zoom)
+        try:
+            os.utime(path)
+            return path.read_bytes()
+        except FileNotFoundError:
+            # not cached, or evicted by another process in the meantime
+            pass
+
+        try:
+            request = urllib.request.Request(url.format(x=x, y=y, z=zoom),
+                                             headers={'User-Agent': 'pm25-paper'})
+            with urllib.request.urlopen(request, timeout=30) as response:
+                data = response.read()
+        except OSError as e:
+            warnings.warn(f'could not fetch tile {zoom}/{x}/{y}: {e}')
+            return None
+
+        # write to a temporary file and move it into place, so another
+        # process never reads a half-written tile
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return data
+
+    def evict(self):
+        '''Drop least recently used tiles until the cache fits maxBytes.'''
+        if not self.directory.exists():
+            return
+        files = []
+        for path in self.directory.rglob('*.png'):
+            try:
+                files.append((path.stat(), path))
+            except FileNotFoundError:
+                pass
+        total = sum(s.st_size for s, _ in files)
+        for stat, path in sorted(files, key=lambda f: f[0].st_mtime):
+            if total <= self.maxBytes:
+                break
+            # other processes may be evicting the same files
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    @timed('tiles', rows=None)
+    def bounds2img(self, w, s, e, n, zoom, url=STAMEN):
+        '''
+        Stitch the tiles covering a EPSG:3857 bounding box.
+
+        Drop-in for contextily.bounds2img.
+
+        Returns
+        -------
+        img : array of uint8, (rows, cols, 4)
+            First row is north.
+        extent : tuple
+            (left, right, bottom, top) of the image in EPSG:3857.
+
+        '''
+        key = (w, s, e, n, zoom, _template(url))
+        if key in self._memo:
+            return self._memo[key]
+
+        x0, y0 = _tileXY(*_toLonLat(w, n), zoom)
+        x1, y1 = _tileXY(*_toLonLat(e, s), zoom)
+
+        img = np.zeros(((y1 - y0 + 1) * TILE_SIZE, (x1 - x0 + 1) * TILE_SIZE, 4), np.uint8)
+        for i, x in enumerate(range(x0, x1 + 1)):
+            for j, y in enumerate(range(y0, y1 + 1)):
+                data = self.tile(x, y, zoom, url)
+                if data is not None:
+                    img[j*TILE_SIZE:(j+1)*TILE_SIZE, i*TILE_SIZE:(i+1)*TILE_SIZE] = _decode(data)
+        if self.offline is None:
+            self.evict()
+
+        left, top = _tileOrigin(x0, y0, zoom)
+        right, bottom = _tileOrigin(x1 + 1, y1 + 1, zoom)
+        self._memo[key] = (img, (left, right, bottom, top))
+        return self._memo[key]
+
+    def extent2img(self, extent, zoom, url=STAMEN):
+        '''
+        bounds2img() of a (lon0, lon1, lat0, lat1) extent. A fixed extent
+        gives the same bounds every time, so every map drawn at it shares
+        one stitched basemap.
+        '''
+        w, s = _fromLonLat(extent[0], extent[2])
+        e, n = _fromLonLat(extent[1], extent[3])
+        return self.bounds2img(w, s, e, n, zoom, url)
+
+
+default = TileCache()
+
+
+def bounds2img(w, s, e, n, zoom, url=STAMEN):
+    '''bounds2img() of the module's default cache.'''
+    return default.bounds2img(w, s, e, n, zoom, url)
+
+
+def extent2img(extent, zoom, url=STAMEN):
+    '''extent2img() of the module's default cache.'''
+    return default.extent2img(extent, zoom, url)
@@ -7,33 +7,25 @@ Created on Mon Jun 13 13:07:05 2022
 @author: jarl
 """
 
-import pandas as pd
-import numpy as np
 from pathlib import Path
-import xarray as xr
+from loader import loadTagged
+from dwell import dwellMatrix
+from resultcache import cachedByRoute
 
 filename = Path('/Users/jarl/Documents/Observatory/ccarph/Jeepney Data/Alldata_tagged.csv')
-df = pd.read_csv(filename, usecols=['Route.Number','calib_pm25', 'TME'], index_col=['Route.Number', 'TME']).rename(columns=dict(Longitude='lon', Latitude='lat'))
+df = loadTagged(filename, usecols=['Route.Number','calib_pm25', 'TME', 'datetime_fixed'], index_col=['Route.Number', 'TME']).rename(columns=dict(Longitude='lon', Latitude='lat'))
+
+# TMEs can also be tagged from polygons instead of the precomputed column
+# (needs Longitude/Latitude in usecols):
+# from geofence import Geofence
+# df['TME'] = Geofence.fromGeoJSON(filename.parent/'TME.geojson').label(df['Longitude'], df['Latitude'])
 
 TMElist = ['UPTC', 'UP', 'Mcdo', 'Ateneo', 'Miriam', 'Terminal', 'Balara']
 routeNumbers = list(df.index.get_level_values(0).unique())
 
-def timeCount(routeNo):
-    global TMElist
-    routedf = df['calib_pm25'].loc[routeNo].sort_index()
-    totaltime = {'UPTC':0, 'UP':0}
-    
-    for TME in TMElist:
-        try:    # try-except is used cause no time is spent in the TME sometimes
-            TMEtime = routedf.loc[TME].count()*15    # time spent at the tme in seconds (minutes=1/4), time spent = # of points * 15 seconds
-            totaltime[TME] = TMEtime                 # add to dictionary
-
-        except:
-            totaltime[TME] = 0
-        
-    return totaltime
-        
-
-timedf = pd.DataFrame([timeCount(routeNo) for routeNo in routeNumbers])
+# seconds spent in each TME per route, from the actual time between fixes;
+# gaps longer than a minute are not counted as dwell; cached per route
+timedf = cachedByRoute('dwell', df, dwellMatrix, {'zones': TMElist, 'maxGap': 60},
+                       key='Route.Number').drop(columns='Route.Number')
 
 timedf[timedf < 5000].boxplot(showfliers=False)
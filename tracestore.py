@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact in-memory store of the traces, sorted by route. Every column is one
+contiguous NumPy array in the smallest fitting dtype, and a CSR-style offsets
+array gives the rows of each route, so a route is a zero-copy slice found in
+O(1) instead of a MultiIndex lookup and a copy.
+Created on Sun Oct 18 08:15:01 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+from loader import getColumn
+from profiling import timed
+
+
+class TraceStore:
+    '''
+    Traces as per-column arrays sorted by route and time.
+
+    Columns are stored as:
+
+    - floats (PM2.5, coordinates): float32, about 1 m resolution at these
+      longitudes, well under the GPS error
+    - datetimes: int64 ns since the epoch
+    - integers: the smallest integer dtype holding their range
+    - strings, categoricals and booleans: integer codes, with the labels
+      in store.categories[name]
+
+    Parameters
+    ----------
+    df : DataFrame
+        Traces with the route and time as columns or index levels.
+    columns : list, optional
+        Columns to keep. The default is every column.
+    route, time : str, optional
+        The defaults are 'Route.Number' and 'datetime_fixed'.
+
+    Examples
+    --------
+    >>> store = TraceStore(df)
+    >>> fixes = store[821]              # dict of views, no copy
+    >>> fixes['calib_pm25'].mean()
+    >>> store.memory()
+
+    '''
+
+    @timed('tracestore', rows=1)
+    def __init__(self, df, columns=None, route='Route.Number', time='datetime_fixed'):
+        self.route, self.time = route, time
+        r = getColumn(df, route)
+        t = getColumn(df, time).astype('datetime64[ns]').astype(np.int64)
+        order = np.lexsort((t, r))
+        r = r[order]
+
+        starts = np.flatnonzero(np.r_[True, r[1:] != r[:-1]])
+        self.routes = r[starts]
+        self.offsets = np.r_[starts, len(r)].astype(np.int64)
+        self._position = {key: i for i, key in enumerate(self.routes.tolist())}
+
+        self.columns = {time: t[order]}
+        self.categories = {}
+        # source dtypes, to cast back to in frame()
+        self.dtypes = {time: getColumn(df, time).dtype}
+        names = [c for c in (df.columns if columns is None else columns) if c not in (route, time)]
+        for name in names:
+            self.columns[name] = self._compact(name, df[name])[order]
+            self.dtypes[name] = df[name].dtype
+
+    def _compact(self, name, col):
+        kind = col.dtype.kind
+        if kind == 'f':
+            return col.values.astype(np.float32)
+        if kind == 'M':
+            return col.values.astype('datetime64[ns]').astype(np.int64)
+        if kind in 'iu':
+            return pd.to_numeric(col, downcast='integer' if kind == 'i' else 'unsigned').values
+        cat = col.astype('category').cat
+        self.categories[name] = cat.categories
+        return cat.codes.values
+
+    def __len__(self):
+        return len(self.routes)
+
+    def __contains__(self, route):
+        return route in self._position
+
+    def __iter__(self):
+        '''(route, views) for every route, in route order.'''
+        for route in self.routes:
+            yield route, self[route]
+
+    def rows(self, route):
+        '''Slice of the rows of a route.'''
+        i = self._position[route]
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def __getitem__(self, route):
+        '''Views of every column for one route.'''
+        rows = self.rows(route)
+        return {name: values[rows] for name, values in self.columns.items()}
+
+    def column(self, name, route=None):
+        '''One column, of all routes or (as a view) of one.'''
+        values = self.columns[name]
+        return values if route is None else values[self.rows(route)]
+
+    def decode(self, name, codes):
+        '''Labels of category codes (code -1 is missing).'''
+        labels = np.asarray(self.categories[name], dtype=object)
+        return np.where(codes >= 0, labels[codes], None)
+
+    def frame(self, route=None):
+        '''
+        Back to a DataFrame (a copy) with the source column dtypes, of all
+        routes or of one. The values are the stored ones, so floats keep
+        only float32 precision.
+        '''
+        rows = slice(None) if route is None else self.rows(route)
+        if route is None:
+            routes = np.repeat(self.routes, np.diff(self.offsets))
+        else:
+            routes = np.repeat(route, rows.stop - rows.start)
+        out = {self.route: routes}
+        for name, values in self.columns.items():
+            values, dtype = values[rows], self.dtypes[name]
+            if name in self.categories:
+                values = pd.Categorical.from_codes(values, self.categories[name])
+            elif dtype.kind == 'M':
+                values = values.astype('datetime64[ns]')
+            out[name] = pd.Series(values).astype(dtype)
+        return pd.DataFrame(out)
+
+    def memory(self, df=None):
+        '''
+        Memory footprint per column in MB, including the offsets and the
+        route lookup, compared with df if given.
+        '''
+        rows = {name: values.nbytes for name, values in self.columns.items()}
+        # the route column is replaced by the routes and their offsets
+        rows[self.route] = self.offsets.nbytes + self.routes.nbytes
+        # dict of ~100 B per route (entry, key and int)
+        rows['(lookup)'] = 100 * len(self.routes)
+        out = pd.DataFrame({'store_mb': pd.Series(rows) / 2**20})
+        if df is not None:
+            usage = df.memory_usage(deep=True, index=False)
+            index = df.index.memory_usage(deep=True)
+            out['frame_mb'] = usage.reindex(out.index) / 2**20
+            out.loc['(index)', 'frame_mb'] = index / 2**20
+        out.loc['total'] = out.sum()
+        return out
@@ -8,34 +8,142 @@ Created on Mon May 30 14:30:14 2022
 
 from pathlib import Path
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-import datetime as dt
+from profiling import timed
 
 file = Path('/Users/jarl/Documents/Observatory/Data/ccar/MOIP_201811-201812.csv')
-df = pd.read_csv(file, usecols=['Datetime','WindSpeed', 'u', 'v'], 
-                 na_values='-999', parse_dates=['Datetime'], 
-                 index_col='Datetime')
 
-df.dropna(inplace=True)
+SECTORS = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
 
-# df = df.loc['2018-Nov-12':'2018-Dec-15']
 
-uv_abs = np.sqrt(df['u']**2 + df['u']**2)
+def loadWind(file=file):
+    '''Wind station record indexed by Datetime, with WindSpeed, u and v.'''
+    df = pd.read_csv(file, usecols=['Datetime', 'WindSpeed', 'u', 'v'],
+                     na_values='-999', parse_dates=['Datetime'],
+                     index_col='Datetime')
+    return df.dropna().sort_index()
 
-fig, ax = plt.subplots(figsize=(12,3))
-q = ax.quiver(df['u'], df['v'], df['WindSpeed'], pivot='mid', scale=50, headwidth=2)
-ax.set_yticklabels([])
-ax.set_yticks([])
-cb = plt.colorbar(q, pad=0.01)
 
-date_grouped = df.groupby(df.index.date)
+@timed()
+def hourlyGrid(wind, start=None, end=None):
+    '''
+    Day x hour grid of the wind from one resample.
 
-fig1, ax1 = plt.subplots()
-for i, date in enumerate(pd.date_range('2018-Nov-12', '2018-Dec-15')):
-    try:
-        daydf = date_grouped.get_group(date)
-        ax1.quiver([daydf.index.hour, i], df['u'], df['v'], df['WindSpeed'])
-    except:
-        pass
-    
\ No newline at end of file
+    Parameters
+    ----------
+    wind : DataFrame
+        From loadWind().
+    start, end : date-like, optional
+        Days to cover; hours without data are NaN. The default is the
+        span of the record.
+
+    Returns
+    -------
+    DataFrame
+        Indexed by date, columns (variable, hour) for u, v, speed (of the
+        mean vector) and WindSpeed (mean scalar speed).
+
+    '''
+    hourly = wind[['u', 'v', 'WindSpeed']].resample('1h').mean()
+    days = pd.date_range(start or hourly.index[0].normalize(),
+                         end or hourly.index[-1].normalize(), freq='D')
+    hours = pd.date_range(days[0], days[-1] + pd.Timedelta('23h'), freq='1h')
+    hourly = hourly.reindex(hours)
+    hourly['speed'] = np.hypot(hourly['u'], hourly['v'])
+
+    hourly.index = pd.MultiIndex.from_arrays([hourly.index.normalize(), hourly.index.hour],
+                                             names=['date', 'hour'])
+    return hourly[['u', 'v', 'speed', 'WindSpeed']].unstack('hour')
+
+
+@timed()
+def joinWind(times, wind, how='nearest', tolerance='1h'):
+    '''
+    Wind at every fix time.
+
+    Both ways are a binary search of the sorted wind record, so the cost
+    is O(n log m) for n fixes and m wind records and the fixes need not be
+    sorted.
+
+    Parameters
+    ----------
+    times : array of datetime64
+        Fix times, e.g. df['datetime_fixed'].values.
+    wind : DataFrame
+        From loadWind().
+    how : 'nearest' or 'interp', optional
+        Take the nearest record, or interpolate linearly between the
+        records either side. The default is 'nearest'.
+    tolerance : str, optional
+        Fixes further than this from a record ('nearest'), or inside a
+        record gap longer than twice this ('interp'), get NaN. The default
+        is '1h'.
+
+    Returns
+    -------
+    DataFrame
+        u, v and WindSpeed, one row per fix in the order of `times`.
+
+    '''
+    t = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+    w = wind.index.values.astype('datetime64[ns]').astype(np.int64)
+    tol = pd.Timedelta(tolerance).value
+    cols = ['u', 'v', 'WindSpeed']
+    values = wind[cols].values
+
+    right = np.clip(np.searchsorted(w, t), 1, len(w) - 1)
+    left = right - 1
+    dl, dr = t - w[left], w[right] - t
+
+    if how == 'nearest':
+        pick = np.where(dr < dl, right, left)
+        out = values[pick]
+        out[np.abs(t - w[pick]) > tol] = np.nan
+    elif how == 'interp':
+        frac = np.clip(dl / (w[right] - w[left]), 0, 1)[:, None]
+        out = values[left] * (1 - frac) + values[right] * frac
+        out[(w[right] - w[left] > 2 * tol) | (dl < -tol) | (dr < -tol)] = np.nan
+    else:
+        raise ValueError(f'unknown join {how!r}')
+
+    return pd.DataFrame(out, columns=cols)
+
+
+def windSector(u, v, calm=0.5):
+    '''
+    Compass sector the wind blows from, or 'calm' below `calm` m/s. Can be
+    used as a stratum of summaryTable() after joinWind().
+    '''
+    u, v = np.asarray(u, dtype=float), np.asarray(v, dtype=float)
+    bearing = np.degrees(np.arctan2(-u, -v)) % 360
+    sector = np.asarray(SECTORS, dtype=object)[np.round(np.nan_to_num(bearing) / 45).astype(int) % 8]
+    sector[np.hypot(u, v) < calm] = 'calm'
+    sector[np.isnan(u) | np.isnan(v)] = None
+    return sector
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    df = loadWind()
+
+    # df = df.loc['2018-Nov-12':'2018-Dec-15']
+
+    fig, ax = plt.subplots(figsize=(12,3))
+    q = ax.quiver(df['u'], df['v'], df['WindSpeed'], pivot='mid', scale=50, headwidth=2)
+    ax.set_yticklabels([])
+    ax.set_yticks([])
+    cb = plt.colorbar(q, pad=0.01)
+
+    # one row of hourly arrows per day
+    grid = hourlyGrid(df, '2018-Nov-12', '2018-Dec-15')
+    hour, day = np.meshgrid(grid['u'].columns, np.arange(len(grid)))
+
+    fig1, ax1 = plt.subplots(figsize=(6,8))
+    q1 = ax1.quiver(hour, day, grid['u'].values, grid['v'].values, grid['speed'].values,
+                    pivot='mid')
+    ax1.set_yticks(np.arange(len(grid))[::7])
+    ax1.set_yticklabels(grid.index[::7].strftime('%b %d'))
+    ax1.invert_yaxis()
+    ax1.set_xlabel('Hour')
+    plt.colorbar(q1, ax=ax1, pad=0.01)